@@ -0,0 +1,78 @@
+# Sales dashboard queries from the daily rollups against ad-hoc aggregation over orders,
+# as the number of orders grows.
+#
+#   python -m benchmarks.analytics --orders 10000,100000,300000
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from benchmarks.common import make_app
+from benchmarks.dataset import generate
+
+ROUNDS = 5
+
+def ad_hoc_summary(days: int):
+    from fruitshop.database import db
+    from fruitshop.shop.models import Order, OrderItem
+
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = (
+        db.session.query(func.date(Order.date_created), func.count(), func.sum(Order.total), func.sum(Order.discount))
+        .filter(Order.date_created >= since)
+        .group_by(func.date(Order.date_created))
+        .all()
+    )
+    fruits = (
+        db.session.query(OrderItem.fruit_id, func.sum(OrderItem.quantity))
+        .join(Order, Order.id == OrderItem.order_id)
+        .filter(Order.date_created >= since)
+        .group_by(OrderItem.fruit_id)
+        .all()
+    )
+    promos = (
+        db.session.query(Order.promo, func.count(), func.sum(Order.discount))
+        .filter(Order.date_created >= since, Order.promo.isnot(None))
+        .group_by(Order.promo)
+        .all()
+    )
+    return daily, fruits, promos
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--orders', default='10000,100000,300000')
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+
+    from fruitshop.database import db
+    from fruitshop.admin.analytics import rebuild_rollups, sales_summary
+
+    print(f'{"orders":>8} {"rebuild":>10} {"window":>7} {"ad hoc":>10} {"rollups":>10}')
+    generated = 0
+    for total in (int(n) for n in args.orders.split(',')):
+        generate(app, 100, total - generated, 0, seed=total)
+        generated = total
+
+        with app.test_request_context():
+            start = time.perf_counter()
+            with db.engine.begin() as connection:
+                rebuild_rollups(connection)
+            rebuild = time.perf_counter() - start
+
+            for days in (30, 365):
+                summary = sales_summary(days)
+                assert summary['orders'] == sum(row[1] for row in ad_hoc_summary(days)[0])
+
+                print(f'{total:>8} {rebuild:>9.2f}s {days:>6}d {timed(ad_hoc_summary, days):>8.1f}ms {timed(sales_summary, days):>8.1f}ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# Counts commits and SQL statements per checkout as the cart grows.
+#
+#   python -m benchmarks.checkout_commits
+import time
+
+from benchmarks.common import make_app, create_user, login, SQLCounter
+
+CART_SIZES = [1, 5, 9]
+ROUNDS = 20
+
+def main():
+    app = make_app()
+    user_id = create_user(app, 'bench', balance=10 ** 9)
+    client = app.test_client()
+    login(client, user_id)
+
+    from fruitshop.database import db
+
+    with app.app_context():
+        engine = db.engine
+
+    print(f'{"items":>6} {"commits":>8} {"queries":>8} {"ms/checkout":>12}')
+    with SQLCounter(engine) as counter:
+        for size in CART_SIZES:
+            cart = {'items': {str(fruit_id): 3 for fruit_id in range(1, size + 1)}, 'promo': '10OFF'}
+
+            counter.reset()
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                response = client.post('/checkout', json=cart)
+                assert response.status_code == 200, response.get_data(as_text=True)
+            elapsed = time.perf_counter() - start
+
+            print(f'{size:>6} {counter.commits / ROUNDS:>8.1f} {counter.statements / ROUNDS:>8.1f} {elapsed / ROUNDS * 1000:>12.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Time to first request for a new worker: a fresh interpreter imports the app, runs
+# create_app() and serves its first pages. Compares compiling templates on first use with
+# loading them from a template cache built beforehand, as the image build does.
+#
+#   python -m benchmarks.cold_start [--runs 5] [--database-uri URI]
+import argparse
+import os
+from statistics import median
+import tempfile
+
+from benchmarks.common import make_app
+
+PATHS = ['/', '/login', '/reviews']
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # The children inherit the migrated scratch database through the environment
+    app = make_app(args.database_uri)
+    os.environ['PAGE_CACHE'] = 'false'
+
+    from fruitshop.startup import cold_start, compile_templates, init_templates, LAZY_MODULES
+
+    cache_path = tempfile.mkdtemp()
+    app.config['TEMPLATE_CACHE_PATH'] = cache_path
+    init_templates(app)
+    compile_templates(app)
+
+    modes = {
+        'compile on first use': {'TEMPLATE_CACHE': 'false'},
+        'prebuilt template cache': {'TEMPLATE_CACHE': 'true', 'TEMPLATE_CACHE_PATH': cache_path},
+    }
+
+    print(f'{"":<24} {"imports":>8} {"create_app":>11} ' + ' '.join(f'{path:>9}' for path in PATHS) + f' {"total":>8}')
+    # Alternate between the modes so both see the same machine noise
+    runs = {mode: [] for mode in modes}
+    for _ in range(args.runs):
+        for mode, env in modes.items():
+            runs[mode].append(cold_start(PATHS, env=env))
+
+    for mode, reports in runs.items():
+        for report in reports:
+            assert all(request['status'] == 200 for request in report['requests']), report['requests']
+            assert not report['lazy_loaded'], f'loaded before the first request: {report["lazy_loaded"]}'
+
+        started = median([report['started_ms'] for report in reports])
+        created = median([report['create_app_ms'] for report in reports])
+        first = [median([report['requests'][i]['ms'] for report in reports]) for i in range(len(PATHS))]
+        total = median([
+            report['started_ms'] + report['create_app_ms'] + sum(request['ms'] for request in report['requests'])
+            for report in reports
+        ])
+        print(f'{mode:<24} {started:>6.0f}ms {created:>9.0f}ms ' + ' '.join(f'{ms:>7.1f}ms' for ms in first) + f' {total:>6.0f}ms')
+
+    print(f'Not loaded before the first requests: {", ".join(LAZY_MODULES)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+from sqlalchemy import event
+
+def make_app(database_uri: str = None):
+    # Default to a throwaway SQLite file so benchmarks never touch a real database
+    scratch = tempfile.mkdtemp()
+    if database_uri is None:
+        database_uri = 'sqlite:///' + os.path.join(scratch, 'bench.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_uri
+    os.environ.setdefault('SESSION_SQLITE_PATH', os.path.join(scratch, 'sessions.db'))
+
+    from fruitshop import create_app
+    from fruitshop.migrations import upgrade
+    app = create_app()
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        upgrade()
+
+    return app
+
+def create_user(app, username: str, balance: float = 1000.0, role: str = 'user') -> int:
+    from fruitshop.database import db
+    from fruitshop.auth.models import User
+
+    with app.app_context():
+        user = User(username=username, password_hash='!', otp_secret='', role=role, balance=balance)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+def login(client, user_id: int, username: str = 'bench', role: str = 'user'):
+    # Skip the password and 2FA steps by writing the session directly
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = username
+        session['role'] = role
+
+class SQLCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = 0
+        self.commits = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.statements += 1
+
+    def _on_commit(self, *args, **kwargs):
+        self.commits += 1
+
+    def reset(self):
+        self.statements = 0
+        self.commits = 0
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        event.listen(self.engine, 'commit', self._on_commit)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+        event.remove(self.engine, 'commit', self._on_commit)
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+def latency_summary(values: list[float]) -> str:
+    # Latencies in seconds, reported in milliseconds
+    return ' '.join(f'p{p}={percentile(values, p) * 1000:.1f}ms' for p in (50, 95, 99))
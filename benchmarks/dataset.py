@@ -0,0 +1,144 @@
+# Fills a database with synthetic users, orders and reviews using bulk inserts.
+#
+#   python -m benchmarks.dataset --database-uri sqlite:////tmp/bench.db --users 1000 --orders 20000 --reviews 5000
+#
+# Every generated user has the password PASSWORD. Balances, ledger entries, the review
+# counter and the review search index are kept consistent, so `flask auth reconcile-balances`
+# finds nothing to fix.
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text, update
+
+PASSWORD = 'bench'
+STARTING_BALANCE = 1000000.0
+BATCH_SIZE = 5000
+PHRASES = (
+    'Fresh and tasty.', 'Arrived a bit bruised.', 'Perfectly ripe.', 'Too sour for me.',
+    'Great value for money.', 'Delivery was quick.', 'Juicy and sweet.', 'Will order again.',
+    'The packaging could be better.', 'My kids loved them.', 'Not as crisp as last time.',
+)
+
+def _next_id(connection, model) -> int:
+    return (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+def _insert_batches(connection, model, rows: list[dict]):
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+def generate(app, users: int, orders: int, reviews: int, seed: int = 0) -> dict:
+    from fruitshop.database import db
+    from fruitshop.auth.models import User, BalanceLedger
+    from fruitshop.auth.utils import hash_password
+    from fruitshop.shop.models import Fruit, Order, OrderItem, OrderReview, ReviewCounter
+    from fruitshop.shop.search import index_reviews
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    with app.test_request_context():
+        # One hash shared by every user, bcrypt is far too slow to run per row
+        password_hash = hash_password(PASSWORD)
+
+        with db.engine.begin() as connection:
+            prices = dict(connection.execute(select(Fruit.id, Fruit.price)).all())
+            names = dict(connection.execute(select(Fruit.id, Fruit.name)).all())
+            fruit_ids = sorted(prices)
+
+            # Explicit ids, so orders, their items and reviews can be linked without reading ids back
+            first_user = _next_id(connection, User)
+            user_ids = list(range(first_user, first_user + users))
+            balances = {user_id: STARTING_BALANCE for user_id in user_ids}
+            ledger = [
+                {'user_id': user_id, 'amount': STARTING_BALANCE, 'reason': 'register', 'order_id': None, 'date_created': now - timedelta(days=365)}
+                for user_id in user_ids
+            ]
+
+            first_order = _next_id(connection, Order)
+            order_rows = []
+            item_rows = []
+            order_fruits = {}
+            for order_id in range(first_order, first_order + orders):
+                user_id = rng.choice(user_ids)
+                date_created = now - timedelta(seconds=rng.randrange(365 * 24 * 60 * 60))
+
+                subtotal = 0.0
+                order_fruits[order_id] = []
+                for fruit_id in rng.sample(fruit_ids, rng.randint(1, min(4, len(fruit_ids)))):
+                    quantity = rng.randint(1, 10)
+                    subtotal += prices[fruit_id] * quantity
+                    order_fruits[order_id].append(names[fruit_id])
+                    item_rows.append({'order_id': order_id, 'fruit_id': fruit_id, 'quantity': quantity})
+
+                total = round(subtotal, 2)
+                balances[user_id] = round(balances[user_id] - total, 2)
+                order_rows.append({
+                    'id': order_id, 'user_id': user_id, 'promo': None,
+                    'subtotal': total, 'discount': 0.0, 'total': total, 'date_created': date_created
+                })
+                ledger.append({'user_id': user_id, 'amount': -total, 'reason': 'order', 'order_id': order_id, 'date_created': date_created})
+
+            first_review = _next_id(connection, OrderReview)
+            review_rows = [
+                {
+                    'id': review_id,
+                    'order_id': order['id'],
+                    'title': f'Review of order {order["id"]}',
+                    'comments': ' '.join(rng.choice(PHRASES) for _ in range(rng.randint(1, 20))),
+                    'date_created': order['date_created'] + timedelta(days=rng.randint(0, 7))
+                }
+                for review_id, order in enumerate(rng.sample(order_rows, min(reviews, len(order_rows))), first_review)
+            ]
+
+            _insert_batches(connection, User, [
+                {'id': user_id, 'username': f'user{user_id}', 'password_hash': password_hash, 'otp_secret': '', 'role': 'user', 'balance': balances[user_id]}
+                for user_id in user_ids
+            ])
+            _insert_batches(connection, Order, order_rows)
+            _insert_batches(connection, OrderItem, item_rows)
+            _insert_batches(connection, OrderReview, review_rows)
+            _insert_batches(connection, BalanceLedger, ledger)
+            for start in range(0, len(review_rows), BATCH_SIZE):
+                index_reviews(connection, [
+                    {'id': review['id'], 'title': review['title'], 'comments': review['comments'], 'fruits': ' '.join(order_fruits[review['order_id']])}
+                    for review in review_rows[start:start + BATCH_SIZE]
+                ])
+
+            # Bulk inserts skip the ORM flush hook that maintains the counter
+            connection.execute(
+                update(ReviewCounter)
+                .where(ReviewCounter.id == 1)
+                .values(review_count=ReviewCounter.review_count + len(review_rows))
+            )
+
+            # Explicit ids don't advance Postgres sequences
+            if connection.dialect.name == 'postgresql':
+                for model in (User, Order, OrderReview):
+                    table = model.__tablename__
+                    connection.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"))
+
+    return {'users': user_ids, 'orders': len(order_rows), 'items': len(item_rows), 'reviews': len(review_rows)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', required=True)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from benchmarks.common import make_app
+    app = make_app(args.database_uri)
+
+    start = time.perf_counter()
+    result = generate(app, args.users, args.orders, args.reviews, args.seed)
+    elapsed = time.perf_counter() - start
+
+    print(f'Inserted {len(result["users"])} users, {result["orders"]} orders ({result["items"]} items) '
+          f'and {result["reviews"]} reviews in {elapsed:.1f}s.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Flash-sale burst: many parallel checkouts through the per-request write path and through
+# group commit, on a fresh database each. Some users run out of balance and the promo code
+# runs out part way, so rejected orders inside a batch are exercised too.
+#
+#   python -m benchmarks.group_commit [--database-uri URI] [--checkouts 1000] [--threads 32]
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import make_app, create_user, login, latency_summary, SQLCounter
+
+def run(args, mode: str):
+    app = make_app(args.database_uri)
+    app.config['CHECKOUT_MODE'] = mode
+    app.config['SLOW_REQUEST_MS'] = 10 ** 6
+
+    from fruitshop.database import db
+    from fruitshop.auth.ledger import reconcile_balances, record_entry
+    from fruitshop.shop.models import Order, Promotion
+    from fruitshop.admin.models import DailySales
+
+    with app.app_context():
+        db.session.add(Promotion(code='FLASH', discount=20, uses_left=args.checkouts // 4))
+        db.session.commit()
+        engine = db.engine
+
+    # Enough balance for about a dozen orders each
+    user_ids = [create_user(app, f'{mode}{i}', balance=100.0) for i in range(args.users)]
+    with app.app_context():
+        for user_id in user_ids:
+            record_entry(user_id, 100.0, 'register')
+        db.session.commit()
+
+    def checkout(i):
+        client = app.test_client()
+        login(client, user_ids[i % len(user_ids)])
+        cart = {'items': {'1': 1, '2': 2}, 'promo': 'FLASH' if i % 2 else ''}
+        start = time.perf_counter()
+        response = client.post('/checkout', json=cart)
+        return response.status_code, time.perf_counter() - start
+
+    with SQLCounter(engine) as counter:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(checkout, range(args.checkouts)))
+        elapsed = time.perf_counter() - start
+
+    statuses = [status for status, _ in results]
+    placed = statuses.count(200)
+    rejected = statuses.count(400)
+    failed = len(statuses) - placed - rejected
+
+    with app.app_context():
+        orders = Order.query.count()
+        promo_orders = Order.query.filter_by(promo='FLASH').count()
+        uses_left = Promotion.query.filter_by(code='FLASH').one().uses_left
+        rollup_orders = db.session.query(db.func.sum(DailySales.orders)).scalar() or 0
+        _, mismatches = reconcile_balances()
+
+    print(f'{mode:>7}: {placed / elapsed:>7.1f} orders/s  {latency_summary([t for _, t in results])}  '
+          f'placed={placed} rejected={rejected} failed={failed} commits={counter.commits}')
+
+    assert orders == placed, 'orders and successful checkouts disagree'
+    assert promo_orders + uses_left == args.checkouts // 4, 'promo code over-redeemed or lost an update'
+    assert rollup_orders == orders, 'rollups out of step with orders'
+    assert not mismatches, f'balances disagree with the ledger: {mismatches[:5]}'
+    return placed / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--checkouts', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    direct = run(args, 'direct')
+    group = run(args, 'group')
+    print(f'group commit: {group / direct:.2f}x the orders/s of the per-request path')
+
+if __name__ == '__main__':
+    main()
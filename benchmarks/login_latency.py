@@ -0,0 +1,75 @@
+# Login p99 latency while other threads browse the shop, with bcrypt inline or on its bounded pool.
+#
+#   python -m benchmarks.login_latency --bcrypt-workers 0
+#   python -m benchmarks.login_latency --bcrypt-workers 2
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import make_app, latency_summary
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--bcrypt-workers', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--browse-threads', type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ['BCRYPT_WORKERS'] = str(args.bcrypt_workers)
+    os.environ['BCRYPT_ROUNDS'] = str(args.rounds)
+    os.environ['LOGIN_RATE_PER_MINUTE'] = '1000000'
+    os.environ['LOGIN_BURST'] = '1000000'
+    app = make_app(args.database_uri)
+
+    from fruitshop.database import db
+    from fruitshop.auth.models import User
+    from fruitshop.auth.utils import hash_password
+
+    with app.test_request_context():
+        db.session.add(User(username='shopper', password_hash=hash_password('hunter2'), otp_secret='', role='user'))
+        db.session.commit()
+
+    login_times = []
+    browse_times = []
+    done = threading.Event()
+
+    def login(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/login', data={'username': 'shopper', 'password': 'hunter2'})
+        login_times.append(time.perf_counter() - start)
+        assert response.headers['Location'].endswith('/login/2fa'), response.headers['Location']
+
+    def browse():
+        client = app.test_client()
+        while not done.is_set():
+            for path in ('/', '/reviews'):
+                start = time.perf_counter()
+                client.get(path)
+                browse_times.append(time.perf_counter() - start)
+
+    browsers = [threading.Thread(target=browse) for _ in range(args.browse_threads)]
+    for browser in browsers:
+        browser.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.login_threads) as pool:
+        list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - start
+
+    done.set()
+    for browser in browsers:
+        browser.join()
+
+    mode = f'{args.bcrypt_workers} bcrypt workers' if args.bcrypt_workers else 'inline bcrypt'
+    print(f'{mode}, cost {args.rounds}, {args.login_threads} login threads, {args.browse_threads} browse threads')
+    print(f'logins: {args.logins} in {elapsed:.2f}s, {latency_summary(login_times)}')
+    print(f'browse: {len(browse_times)} requests, {latency_summary(browse_times)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# A shopper building a cart: one POST /checkout/preview per add, remove and promo apply,
+# against one cacheable price sheet plus a promo check, with the cart priced in the browser.
+# Also checks that checkout rejects a price sheet made stale by a price change.
+#
+#   python -m benchmarks.price_sheet [--shoppers 200]
+import argparse
+import time
+
+from sqlalchemy import update
+
+from benchmarks.common import make_app, create_user, login, SQLCounter
+
+# Item ids after each add or remove, then the promo code
+STEPS = [{'1': 1}, {'1': 2}, {'1': 2, '3': 1}, {'1': 2, '3': 2}, {'1': 2, '3': 2, '5': 1},
+         {'1': 2, '5': 1}, {'1': 2, '5': 1, '2': 3}, {'1': 2, '5': 1, '2': 4}]
+
+def price_locally(sheet: dict, items: dict, discount: float) -> float:
+    # What cart.js does with the sheet
+    subtotal = round(sum(sheet['prices'][fruit_id] * quantity for fruit_id, quantity in items.items()), 2)
+    return round(subtotal - min(round(discount / 100 * subtotal, 2), subtotal), 2)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--shoppers', type=int, default=200)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+    app.config['SLOW_REQUEST_MS'] = 10 ** 6
+    user_id = create_user(app, 'bench', balance=10 ** 6)
+    client = app.test_client()
+    login(client, user_id)
+
+    from fruitshop.database import db
+    from fruitshop.shop.models import Fruit, CatalogVersion
+
+    with app.app_context():
+        engine = db.engine
+
+    def server_preview():
+        for items in STEPS + [STEPS[-1]]:
+            response = client.post('/checkout/preview', json={'items': items, 'promo': '10OFF'})
+            assert response.status_code == 200
+        return len(STEPS) + 1
+
+    def price_sheet():
+        # The first page load fetches the sheet, later ones revalidate it once max-age runs out
+        response = client.get('/checkout/prices')
+        assert response.status_code == 200
+        sheet = response.json
+        assert client.get('/checkout/prices', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+        promo = client.get('/checkout/promo?code=10OFF')
+        assert promo.status_code == 200
+        return 3, sheet, promo.json['discount']
+
+    print(f'{"":<22} {"requests":>9} {"queries":>8} {"ms/shopper":>11}')
+    with SQLCounter(engine) as counter:
+        for name, shop in (('preview per change', server_preview), ('price sheet', price_sheet)):
+            counter.reset()
+            start = time.perf_counter()
+            for _ in range(args.shoppers):
+                result = shop()
+            elapsed = time.perf_counter() - start
+            requests = result if isinstance(result, int) else result[0]
+            print(f'{name:<22} {requests:>9} {counter.statements / args.shoppers:>8.1f} {elapsed / args.shoppers * 1000:>11.2f}')
+
+    # Prices worked out from the sheet match the server's
+    _, sheet, discount = price_sheet()
+    preview = client.post('/checkout/preview', json={'items': STEPS[-1], 'promo': '10OFF'}).json
+    assert price_locally(sheet, STEPS[-1], discount) == preview['total'], 'local pricing disagrees with the server'
+
+    # A price change makes the sheet stale, checkout turns it away, a fresh sheet goes through
+    with app.app_context():
+        db.session.get(Fruit, 1).price += 1
+        db.session.commit()
+    cart = {'items': STEPS[-1], 'promo': '10OFF', 'price_version': sheet['version']}
+    response = client.post('/checkout', json=cart)
+    assert response.status_code == 409, response.status_code
+
+    fresh = client.get('/checkout/prices').json
+    assert fresh['version'] != sheet['version']
+    response = client.post('/checkout', json={**cart, 'price_version': fresh['version']})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    order = client.get(f'/orders/{response.json["order_id"]}')
+    assert order.status_code == 200
+    assert f'{price_locally(fresh, STEPS[-1], discount):.2f}' in order.get_data(as_text=True)
+    print('OK: stale price sheet rejected at checkout, fresh one charged as priced')
+
+    # Another worker changes a price and hands out the new sheet while this worker's
+    # snapshot is still within its TTL: checkout catches up instead of turning it away
+    with engine.begin() as connection:
+        connection.execute(update(Fruit).where(Fruit.id == 1).values(price=Fruit.price + 1))
+        connection.execute(update(CatalogVersion).values(version=CatalogVersion.version + 1))
+    newer = {**fresh, 'version': fresh['version'] + 1, 'prices': {**fresh['prices'], '1': fresh['prices']['1'] + 1}}
+    response = client.post('/checkout', json={**cart, 'price_version': newer['version']})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    order = client.get(f'/orders/{response.json["order_id"]}')
+    assert f'{price_locally(newer, STEPS[-1], discount):.2f}' in order.get_data(as_text=True)
+    print('OK: a sheet newer than this worker\'s catalog is accepted after a refresh')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Bulk promo code generation, CSV import and streaming CSV export, with the export's peak
+# memory next to loading every code at once.
+#
+#   python -m benchmarks.promo_bulk --codes 200000
+import argparse
+import io
+import time
+import tracemalloc
+
+from benchmarks.common import make_app, login
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--codes', type=int, default=200000)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+
+    from fruitshop.shop.models import Promotion
+    from fruitshop.admin.promos import generate_codes
+
+    with app.test_request_context():
+        start = time.perf_counter()
+        generated = generate_codes('GEN-', args.codes, 10, 1)
+        print(f'generate: {generated} codes in {time.perf_counter() - start:.2f}s')
+
+    client = app.test_client()
+    login(client, 1, 'admin', 'admin')
+
+    rows = ''.join(f'IMP-{i:08d},5,1\n' for i in range(args.codes))
+    upload = io.BytesIO(('code,discount,uses_left\n' + rows).encode())
+    start = time.perf_counter()
+    response = client.post('/admin/promo/import', data={'file': (upload, 'codes.csv')}, content_type='multipart/form-data')
+    assert response.status_code == 302
+    print(f'import: {args.codes} codes in {time.perf_counter() - start:.2f}s')
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get('/admin/promo/export.csv', buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'streaming export: {size / 1e6:.1f}MB in {time.perf_counter() - start:.2f}s, peak {peak / 1e6:.1f}MB')
+
+    tracemalloc.start()
+    with app.test_request_context():
+        start = time.perf_counter()
+        promos = Promotion.query.all()
+        _, peak = tracemalloc.get_traced_memory()
+        print(f'loading all {len(promos)} codes: {time.perf_counter() - start:.2f}s, peak {peak / 1e6:.1f}MB')
+    tracemalloc.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Fires many parallel checkouts at one promo code and checks it is never over-redeemed.
+#
+#   python -m benchmarks.promo_contention [--database-uri URI] [--shards 8]
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import make_app, create_user, login
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--checkouts', type=int, default=400)
+    parser.add_argument('--uses', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--shards', type=int, default=0)
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+
+    from fruitshop.database import db
+    from fruitshop.shop.models import Order, Promotion
+    from fruitshop.shop.promotions import shard_promo, remaining_uses
+
+    with app.app_context():
+        promo = Promotion(code='HOT', discount=10, uses_left=args.uses)
+        db.session.add(promo)
+        db.session.commit()
+        if args.shards:
+            shard_promo(promo, args.shards)
+
+    user_ids = [create_user(app, f'bench{i}', balance=10 ** 9) for i in range(args.threads)]
+    cart = {'items': {'1': 1, '2': 2}, 'promo': 'HOT'}
+
+    def checkout(i):
+        client = app.test_client()
+        login(client, user_ids[i % len(user_ids)])
+        return client.post('/checkout', json=cart).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(checkout, range(args.checkouts)))
+    elapsed = time.perf_counter() - start
+
+    redeemed = statuses.count(200)
+    expired = statuses.count(400)
+    failed = len(statuses) - redeemed - expired
+
+    with app.app_context():
+        promo = Promotion.query.filter_by(code='HOT').one()
+        left = remaining_uses(promo)
+        promo_orders = Order.query.filter_by(promo='HOT').count()
+
+    print(f'mode: {"%d shards" % args.shards if args.shards else "single row"}, threads: {args.threads}')
+    print(f'checkouts: {len(statuses)} in {elapsed:.2f}s ({len(statuses) / elapsed:.1f}/s)')
+    print(f'redeemed: {redeemed}, expired: {expired}, failed: {failed}, uses left: {left}')
+
+    assert promo_orders == redeemed, 'orders and successful checkouts disagree'
+    assert redeemed <= args.uses, 'promo code was over-redeemed'
+    assert left == args.uses - redeemed, 'lost update on the promo counter'
+    print('OK: promo code never over-redeemed')
+
+if __name__ == '__main__':
+    main()
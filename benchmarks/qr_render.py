@@ -0,0 +1,51 @@
+# Registration 2FA page render time: a PNG QR code rasterized into every page view
+# (the old Flask-QRcode approach) against the cached SVG endpoint.
+#
+#   python -m benchmarks.qr_render
+import base64
+import io
+import os
+import time
+
+from benchmarks.common import make_app
+
+VIEWS = 200
+
+def main():
+    os.environ['BCRYPT_ROUNDS'] = '4'
+    app = make_app()
+
+    import qrcode
+    from fruitshop.auth.qr import provisioning_uri
+
+    client = app.test_client()
+    client.post('/register', data={'username': 'newcomer', 'password': 'hunter2'})
+
+    with client.session_transaction() as session:
+        otp_url = provisioning_uri(session['register_username'], session['register_otp_secret'])
+
+    # Before: encode and rasterize a PNG on every view, as Flask-QRcode did
+    start = time.perf_counter()
+    for _ in range(VIEWS):
+        client.get('/register/2fa')
+        image = qrcode.make(otp_url)
+        buffer = io.BytesIO()
+        image.save(buffer)
+        data_uri = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    png_elapsed = time.perf_counter() - start
+
+    # After: page render plus the SVG request, which the browser then revalidates with its ETag
+    start = time.perf_counter()
+    response = client.get('/register/2fa/qr.svg')
+    etag = response.headers['ETag']
+    svg_bytes = len(response.get_data())
+    for _ in range(VIEWS):
+        client.get('/register/2fa')
+        assert client.get('/register/2fa/qr.svg', headers={'If-None-Match': etag}).status_code == 304
+    svg_elapsed = time.perf_counter() - start
+
+    print(f'PNG per view:  {png_elapsed / VIEWS * 1000:.2f} ms/view, {len(data_uri)} bytes inlined in every page')
+    print(f'cached SVG:    {svg_elapsed / VIEWS * 1000:.2f} ms/view, {svg_bytes} bytes fetched once')
+
+if __name__ == '__main__':
+    main()
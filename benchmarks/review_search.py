@@ -0,0 +1,50 @@
+# Review search through the full-text index against LIKE '%word%' over the comments, as the
+# number of reviews grows.
+#
+#   python -m benchmarks.review_search --reviews 10000,50000,100000
+import argparse
+import time
+
+from benchmarks.common import make_app
+from benchmarks.dataset import generate
+
+QUERIES = ('juicy', 'bruised kiwi', 'watermelon sweet')
+ROUNDS = 5
+
+def like_search(words: list[str]):
+    from fruitshop.database import db
+    from fruitshop.shop.models import OrderReview
+
+    query = db.session.query(OrderReview.id)
+    for word in words:
+        query = query.filter(OrderReview.comments.ilike(f'%{word}%') | OrderReview.title.ilike(f'%{word}%'))
+    return query.order_by(OrderReview.id.desc()).limit(10).all()
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-uri', default=None)
+    parser.add_argument('--reviews', default='10000,50000,100000')
+    args = parser.parse_args()
+
+    app = make_app(args.database_uri)
+
+    from fruitshop.shop.search import search_reviews
+
+    print(f'{"reviews":>8} {"query":<18} {"index":>9} {"LIKE":>9}')
+    generated = 0
+    for total in (int(n) for n in args.reviews.split(',')):
+        generate(app, 100, total - generated, total - generated, seed=total)
+        generated = total
+
+        with app.test_request_context():
+            for query in QUERIES:
+                print(f'{total:>8} {query:<18} {timed(search_reviews, query):>7.1f}ms {timed(like_search, query.split()):>7.1f}ms')
+
+if __name__ == '__main__':
+    main()
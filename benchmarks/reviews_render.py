@@ -0,0 +1,56 @@
+# Render time for a page of nine reviews with many items each, with the review card
+# fragment cache cold (every card rendered) and warm (every card a cache hit).
+#
+#   python -m benchmarks.reviews_render [--items 40]
+import argparse
+import time
+
+from sqlalchemy import insert
+
+from benchmarks.common import make_app, create_user, SQLCounter, latency_summary
+
+ROUNDS = 200
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=40)
+    args = parser.parse_args()
+
+    app = make_app()
+    user_id = create_user(app, 'reviewer')
+
+    from fruitshop.database import db
+    from fruitshop.shop.models import Order, OrderItem, OrderReview
+    from fruitshop.shop.reviews import review_card_cache
+
+    with app.app_context():
+        for i in range(9):
+            order = Order(user_id=user_id, subtotal=1, discount=0, total=1)
+            db.session.add(order)
+            db.session.flush()
+            db.session.execute(insert(OrderItem), [
+                {'order_id': order.id, 'fruit_id': n % 9 + 1, 'quantity': 1}
+                for n in range(args.items)
+            ])
+            db.session.add(OrderReview(order_id=order.id, title=f'Review {i}', comments='Fresh and juicy. ' * 20))
+        db.session.commit()
+        engine = db.engine
+
+    client = app.test_client()
+    client.get('/reviews')
+
+    with SQLCounter(engine) as counter:
+        for label, clear in (('cold', True), ('warm', False)):
+            times = []
+            counter.reset()
+            for _ in range(ROUNDS):
+                if clear:
+                    review_card_cache.clear()
+                start = time.perf_counter()
+                client.get('/reviews')
+                times.append(time.perf_counter() - start)
+
+            print(f'{label}: {args.items} items/review, {counter.statements / ROUNDS:.1f} queries/page, {latency_summary(times)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Cookie size and per-request session cost for each session backend, measured on a
+# session in the middle of registration (password hash, OTP secret and codes).
+#
+#   python -m benchmarks.session_overhead
+import os
+import subprocess
+import sys
+import time
+
+REQUESTS = 500
+
+def measure(backend: str):
+    os.environ['SESSION_BACKEND'] = backend
+    os.environ['BCRYPT_ROUNDS'] = '4'
+
+    from flask import request
+    from benchmarks.common import make_app
+    app = make_app()
+    client = app.test_client()
+
+    client.post('/register', data={'username': 'newcomer', 'password': 'hunter2'})
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    cookie_bytes = len(cookie.value) if cookie else 0
+
+    # A light page, so the cost is mostly session handling
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        client.get('/register')
+    elapsed = time.perf_counter() - start
+
+    # Session open + save alone
+    with app.test_request_context('/', headers={'Cookie': f'{app.config["SESSION_COOKIE_NAME"]}={cookie.value}'}):
+        interface = app.session_interface
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            session = interface.open_session(app, request)
+            session['touched'] = True
+            interface.save_session(app, session, app.response_class())
+        session_elapsed = time.perf_counter() - start
+
+    print(f'{backend:>7} {cookie_bytes:>13} {elapsed / REQUESTS * 1000:>11.3f} {session_elapsed / REQUESTS * 1000:>13.3f}')
+
+def main():
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+        return
+
+    # One process per backend, so each gets a fresh app
+    print(f'{"backend":>7} {"cookie bytes":>13} {"ms/request":>11} {"ms/session io":>13}')
+    for backend in ('cookie', 'memory', 'sqlite'):
+        subprocess.run([sys.executable, '-m', 'benchmarks.session_overhead', backend], check=True)
+
+if __name__ == '__main__':
+    main()
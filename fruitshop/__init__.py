@@ -1,5 +1,4 @@
 from flask import Flask
-from flask_qrcode import QRcode
 from fruitshop.config import Config
 import os
 
@@ -10,14 +9,79 @@ def create_app():
     app.config.from_object(Config)
     
     # Load also from env vars
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI')
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', Config.SECRET_KEY)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', Config.SQLALCHEMY_DATABASE_URI)
+    app.config['CATALOG_TTL'] = float(os.environ.get('CATALOG_TTL', Config.CATALOG_TTL))
+    app.config['BCRYPT_ROUNDS'] = int(os.environ.get('BCRYPT_ROUNDS', Config.BCRYPT_ROUNDS))
+    app.config['BCRYPT_WORKERS'] = int(os.environ.get('BCRYPT_WORKERS', Config.BCRYPT_WORKERS))
+    app.config['BCRYPT_QUEUE'] = int(os.environ.get('BCRYPT_QUEUE', Config.BCRYPT_QUEUE))
+    app.config['LOGIN_RATE_PER_MINUTE'] = float(os.environ.get('LOGIN_RATE_PER_MINUTE', Config.LOGIN_RATE_PER_MINUTE))
+    app.config['LOGIN_BURST'] = int(os.environ.get('LOGIN_BURST', Config.LOGIN_BURST))
+    app.config['CHECKOUT_MODE'] = os.environ.get('CHECKOUT_MODE', Config.CHECKOUT_MODE)
+    app.config['CHECKOUT_BATCH_SIZE'] = int(os.environ.get('CHECKOUT_BATCH_SIZE', Config.CHECKOUT_BATCH_SIZE))
+    app.config['CHECKOUT_MAX_WAIT_MS'] = float(os.environ.get('CHECKOUT_MAX_WAIT_MS', Config.CHECKOUT_MAX_WAIT_MS))
+    app.config['CHECKOUT_QUEUE'] = int(os.environ.get('CHECKOUT_QUEUE', Config.CHECKOUT_QUEUE))
+    app.config['CHECKOUT_WAIT_MS'] = float(os.environ.get('CHECKOUT_WAIT_MS', Config.CHECKOUT_WAIT_MS))
+    app.config['IDENTITY_CACHE_SIZE'] = int(os.environ.get('IDENTITY_CACHE_SIZE', Config.IDENTITY_CACHE_SIZE))
+    app.config['IDENTITY_CACHE_TTL'] = float(os.environ.get('IDENTITY_CACHE_TTL', Config.IDENTITY_CACHE_TTL))
+    app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', Config.SESSION_BACKEND)
+    app.config['SESSION_SQLITE_PATH'] = os.environ.get('SESSION_SQLITE_PATH', Config.SESSION_SQLITE_PATH)
+    app.config['SESSION_LIFETIME'] = float(os.environ.get('SESSION_LIFETIME', Config.SESSION_LIFETIME))
+    app.config['TEMPLATE_CACHE'] = os.environ.get('TEMPLATE_CACHE', str(Config.TEMPLATE_CACHE)).lower() in ('1', 'true', 'yes')
+    app.config['TEMPLATE_CACHE_PATH'] = os.environ.get('TEMPLATE_CACHE_PATH', Config.TEMPLATE_CACHE_PATH)
+    app.config['PAGE_CACHE'] = os.environ.get('PAGE_CACHE', str(Config.PAGE_CACHE)).lower() in ('1', 'true', 'yes')
+    app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', Config.PAGE_CACHE_SIZE))
+    app.config['PAGE_CACHE_SHARED_PATH'] = os.environ.get('PAGE_CACHE_SHARED_PATH', Config.PAGE_CACHE_SHARED_PATH)
+    app.config['METRICS'] = os.environ.get('METRICS', str(Config.METRICS)).lower() in ('1', 'true', 'yes')
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', Config.SLOW_REQUEST_MS))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', Config.N_PLUS_ONE_THRESHOLD))
     
-    # Init the database
-    from fruitshop.database import db, init_database
+    # Size the connection pool per worker process (SQLite keeps SQLAlchemy's own pooling)
+    pool_options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', Config.DB_POOL_SIZE)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', Config.DB_MAX_OVERFLOW)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', Config.DB_POOL_TIMEOUT)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', Config.DB_POOL_RECYCLE)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', str(Config.DB_POOL_PRE_PING)).lower() in ('1', 'true', 'yes'),
+    }
+    if not (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_options
+    
+    # Optional read replicas for the read-only shop pages
+    from fruitshop.replicas import replica_binds
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(os.environ.get('SQLALCHEMY_REPLICA_URIS', Config.SQLALCHEMY_REPLICA_URIS), pool_options)
+    app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', Config.REPLICA_MAX_LAG))
+    app.config['REPLICA_CHECK_INTERVAL'] = float(os.environ.get('REPLICA_CHECK_INTERVAL', Config.REPLICA_CHECK_INTERVAL))
+    app.config['REPLICA_PIN_SECONDS'] = float(os.environ.get('REPLICA_PIN_SECONDS', Config.REPLICA_PIN_SECONDS))
+    app.config['REPLICA_HEARTBEAT_INTERVAL'] = float(os.environ.get('REPLICA_HEARTBEAT_INTERVAL', Config.REPLICA_HEARTBEAT_INTERVAL))
+    
+    # Init the database, the schema itself is managed by `flask db-upgrade`
+    from fruitshop.database import db
+    from fruitshop.migrations import upgrade_command
+    from fruitshop.replicas import init_replicas
     db.init_app(app)
-
-    with app.app_context():
-        init_database(db)
+    init_replicas(app)
+    app.cli.add_command(upgrade_command)
+    
+    # Time requests, SQL, templates and bcrypt per endpoint
+    from fruitshop.metrics import init_metrics
+    init_metrics(app)
+    
+    # Keep session data on the server, the cookie only holds its id
+    from fruitshop.sessions import init_sessions
+    init_sessions(app)
+    
+    # Resized, content-hashed images
+    from fruitshop.images import init_images
+    init_images(app)
+    
+    # Templates compiled once, at image build or by the first worker, not on every start
+    from fruitshop.startup import init_templates
+    init_templates(app)
+    
+    # Cache anonymous catalog and review pages
+    from fruitshop.page_cache import page_cache
+    page_cache.init_app(app)
     
     # Setup routes
     from fruitshop.shop.routes import bp as shop_bp
@@ -26,8 +90,5 @@ def create_app():
     app.register_blueprint(shop_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
-    
-    # Init the QRcode extension
-    QRcode(app)
 
     return app
\ No newline at end of file
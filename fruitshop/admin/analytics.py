@@ -0,0 +1,147 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, text
+
+from fruitshop.database import db
+from fruitshop.admin.models import DailySales, DailyFruitSales, DailyPromoRedemptions
+from fruitshop.shop.models import Order, OrderItem
+
+ROLLUPS = (DailySales, DailyFruitSales, DailyPromoRedemptions)
+
+def _upsert(connection, model, rows: list[dict], increments: tuple):
+    # Add to the day's row, or create it, in one statement
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(model)
+    columns = model.__table__.c
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.name for column in model.__table__.primary_key],
+        set_={name: columns[name] + statement.excluded[name] for name in increments}
+    )
+    connection.execute(statement, rows)
+
+def record_orders(connection, orders: list[tuple]):
+    # orders: (date_created, priced cart, promo code or None). Called inside the checkout
+    # transaction, so the rollups commit or roll back with the orders.
+    sales = defaultdict(lambda: {'orders': 0, 'subtotal': 0.0, 'discount': 0.0, 'revenue': 0.0})
+    units = defaultdict(int)
+    promos = defaultdict(lambda: {'redemptions': 0, 'discount': 0.0})
+    for date_created, priced_cart, promo_code in orders:
+        day = date_created.date()
+        totals = sales[day]
+        totals['orders'] += 1
+        totals['subtotal'] += priced_cart.subtotal
+        totals['discount'] += priced_cart.discount
+        totals['revenue'] += priced_cart.total
+        for item in priced_cart.items:
+            units[(day, item.fruit_id)] += item.quantity
+        if promo_code:
+            promos[(day, promo_code)]['redemptions'] += 1
+            promos[(day, promo_code)]['discount'] += priced_cart.discount
+
+    # Rows in key order, so concurrent transactions lock them in the same order
+    _upsert(connection, DailySales, [
+        {'day': day, **totals} for day, totals in sorted(sales.items())
+    ], ('orders', 'subtotal', 'discount', 'revenue'))
+    _upsert(connection, DailyFruitSales, [
+        {'day': day, 'fruit_id': fruit_id, 'units': n} for (day, fruit_id), n in sorted(units.items())
+    ], ('units',))
+    if promos:
+        _upsert(connection, DailyPromoRedemptions, [
+            {'day': day, 'promo': promo, **totals} for (day, promo), totals in sorted(promos.items())
+        ], ('redemptions', 'discount'))
+
+def record_order(connection, date_created: datetime, priced_cart, promo_code: str = None):
+    record_orders(connection, [(date_created, priced_cart, promo_code)])
+
+def rebuild_rollups(connection, batch_size: int = 5000) -> int:
+    # Clearing the rollups first takes their write locks, so checkouts committing meanwhile
+    # wait for the rebuild instead of being counted twice or missed
+    if connection.dialect.name == 'postgresql':
+        tables = ', '.join(model.__tablename__ for model in ROLLUPS)
+        connection.execute(text(f'LOCK TABLE {tables} IN EXCLUSIVE MODE'))
+    for model in ROLLUPS:
+        connection.execute(delete(model))
+
+    # Orders are streamed, only the per-day totals are held in memory
+    sales = defaultdict(lambda: {'orders': 0, 'subtotal': 0.0, 'discount': 0.0, 'revenue': 0.0})
+    promos = defaultdict(lambda: {'redemptions': 0, 'discount': 0.0})
+    orders = connection.execute(
+        select(Order.date_created, Order.subtotal, Order.discount, Order.total, Order.promo)
+        .execution_options(yield_per=batch_size)
+    )
+    count = 0
+    for date_created, subtotal, discount, total, promo in orders:
+        day = date_created.date()
+        totals = sales[day]
+        totals['orders'] += 1
+        totals['subtotal'] += subtotal
+        totals['discount'] += discount
+        totals['revenue'] += total
+        if promo:
+            promos[(day, promo)]['redemptions'] += 1
+            promos[(day, promo)]['discount'] += discount
+        count += 1
+
+    units = defaultdict(int)
+    items = connection.execute(
+        select(Order.date_created, OrderItem.fruit_id, OrderItem.quantity)
+        .join(Order, Order.id == OrderItem.order_id)
+        .execution_options(yield_per=batch_size)
+    )
+    for date_created, fruit_id, quantity in items:
+        units[(date_created.date(), fruit_id)] += quantity
+
+    rows = {
+        DailySales: [{'day': day, **totals} for day, totals in sales.items()],
+        DailyFruitSales: [{'day': day, 'fruit_id': fruit_id, 'units': n} for (day, fruit_id), n in units.items()],
+        DailyPromoRedemptions: [{'day': day, 'promo': promo, **totals} for (day, promo), totals in promos.items()],
+    }
+    for model, model_rows in rows.items():
+        for start in range(0, len(model_rows), batch_size):
+            connection.execute(model.__table__.insert(), model_rows[start:start + batch_size])
+
+    return count
+
+def sales_summary(days: int) -> dict:
+    # Reads at most a few rows per day of the window, however many orders there are
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    daily = (
+        DailySales.query
+        .filter(DailySales.day >= since)
+        .order_by(DailySales.day.desc())
+        .all()
+    )
+    fruits = (
+        db.session.query(DailyFruitSales.fruit_id, func.sum(DailyFruitSales.units))
+        .filter(DailyFruitSales.day >= since)
+        .group_by(DailyFruitSales.fruit_id)
+        .order_by(func.sum(DailyFruitSales.units).desc())
+        .all()
+    )
+    promos = (
+        db.session.query(
+            DailyPromoRedemptions.promo,
+            func.sum(DailyPromoRedemptions.redemptions),
+            func.sum(DailyPromoRedemptions.discount)
+        )
+        .filter(DailyPromoRedemptions.day >= since)
+        .group_by(DailyPromoRedemptions.promo)
+        .order_by(func.sum(DailyPromoRedemptions.redemptions).desc())
+        .all()
+    )
+
+    return {
+        'since': since,
+        'daily': daily,
+        'orders': sum(day.orders for day in daily),
+        'revenue': round(sum(day.revenue for day in daily), 2),
+        'discount': round(sum(day.discount for day in daily), 2),
+        'fruits': fruits,
+        'promos': promos
+    }
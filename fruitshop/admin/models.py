@@ -0,0 +1,21 @@
+from fruitshop.database import db
+
+# Daily rollups, kept up to date by checkout and rebuilt by `flask admin rebuild-analytics`
+
+class DailySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    subtotal = db.Column(db.Float, nullable=False, default=0.0)
+    discount = db.Column(db.Float, nullable=False, default=0.0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0) # order totals, after discount
+
+class DailyFruitSales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    fruit_id = db.Column(db.Integer, db.ForeignKey('fruit.id'), primary_key=True, autoincrement=False)
+    units = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyPromoRedemptions(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    promo = db.Column(db.String(100), primary_key=True)
+    redemptions = db.Column(db.Integer, nullable=False, default=0)
+    discount = db.Column(db.Float, nullable=False, default=0.0)
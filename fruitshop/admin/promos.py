@@ -0,0 +1,150 @@
+import csv
+import io
+import secrets
+
+from sqlalchemy import case, func, select
+
+from fruitshop.database import db
+from fruitshop.shop.models import Promotion, PromotionShard
+
+CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789' # no 0/O or 1/I look-alikes
+CSV_COLUMNS = ('code', 'discount', 'uses_left')
+BATCH_SIZE = 1000
+MAX_PREFIX_LENGTH = 90 # leaves room for the random part within a 100-character code
+
+class PromoImportError(Exception):
+    pass
+
+def _insert_new(rows: list[dict]) -> int:
+    # Codes that already exist are skipped rather than failing the whole batch
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(Promotion).on_conflict_do_nothing(index_elements=['code']).returning(Promotion.id)
+    return len(db.session.execute(statement, rows).all())
+
+def clean_prefix(prefix: str) -> str:
+    # Shared by the admin page and the generate-promos command
+    prefix = prefix.strip()
+    if len(prefix) > MAX_PREFIX_LENGTH:
+        raise ValueError(f'The prefix can be at most {MAX_PREFIX_LENGTH} characters long.')
+    return prefix
+
+def generate_codes(prefix: str, count: int, discount: float, uses_left: int, length: int = 8) -> int:
+    # Random codes, inserted and committed a batch at a time
+    generated = 0
+    while generated < count:
+        batch = min(BATCH_SIZE, count - generated)
+        codes = {prefix + ''.join(secrets.choice(CODE_ALPHABET) for _ in range(length)) for _ in range(batch)}
+        generated += _insert_new([
+            {'code': code, 'discount': discount, 'uses_left': uses_left, 'shards': 0}
+            for code in codes
+        ])
+        db.session.commit()
+
+    return generated
+
+def parse_row(row: dict) -> dict:
+    # Same rules as adding a single code in the admin page
+    try:
+        code = row['code'].strip()
+        discount = round(float(row['discount']), 2)
+        uses_left = int(row['uses_left'])
+    except (KeyError, AttributeError, TypeError, ValueError):
+        raise PromoImportError('Missing or invalid value.')
+
+    if not code or len(code) > 100:
+        raise PromoImportError('Codes must be 1 to 100 characters long.')
+    if not 0 <= discount <= 100:
+        raise PromoImportError('Discount must be between 0 and 100.')
+    if uses_left < 0:
+        raise PromoImportError('Uses left cannot be negative.')
+
+    return {'code': code, 'discount': discount, 'uses_left': uses_left, 'shards': 0}
+
+def import_csv(stream) -> dict:
+    # Reads the file row by row and commits every BATCH_SIZE codes, so memory stays flat
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or not set(CSV_COLUMNS) <= set(reader.fieldnames):
+        raise PromoImportError(f'The CSV needs a header with {", ".join(CSV_COLUMNS)}.')
+
+    result = {'imported': 0, 'skipped': 0, 'invalid': 0}
+    batch = {}
+
+    def flush():
+        inserted = _insert_new(list(batch.values()))
+        db.session.commit()
+        result['imported'] += inserted
+        result['skipped'] += len(batch) - inserted
+        batch.clear()
+
+    for row in reader:
+        try:
+            promo = parse_row(row)
+        except PromoImportError:
+            result['invalid'] += 1
+            continue
+
+        # A code repeated within the file counts as skipped, the first row wins
+        if promo['code'] in batch:
+            result['skipped'] += 1
+            continue
+        batch[promo['code']] = promo
+        if len(batch) >= BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
+
+    return result
+
+def _uses_left():
+    # Sharded codes keep their uses in the shard rows
+    return case(
+        (
+            Promotion.shards > 0,
+            select(func.coalesce(func.sum(PromotionShard.uses_left), 0))
+            .where(PromotionShard.promotion_id == Promotion.id)
+            .scalar_subquery()
+        ),
+        else_=Promotion.uses_left
+    )
+
+def _prefix_filter(query, prefix: str):
+    if not prefix:
+        return query
+
+    # LIKE 'prefix%' on Postgres, served by the text_pattern_ops index whatever the database
+    # collation. SQLite's LIKE ignores case, so there a range on code, which its bytewise
+    # comparison makes exact, served by the code index.
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return query.where(Promotion.code.startswith(prefix, autoescape=True))
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return query.where(Promotion.code >= prefix, Promotion.code < upper)
+
+def search_promos(prefix: str = '', after: str = None, limit: int = 50) -> tuple[list, bool]:
+    # Keyset pagination by code: (promo, uses left) rows, and whether there's another page
+    query = _prefix_filter(select(Promotion, _uses_left()), prefix)
+    if after:
+        query = query.where(Promotion.code > after)
+
+    rows = db.session.execute(query.order_by(Promotion.code).limit(limit + 1)).all()
+    return rows[:limit], len(rows) > limit
+
+def export_csv(prefix: str = '', batch_size: int = BATCH_SIZE):
+    # Yields CSV text in chunks while rows stream from a server-side cursor
+    query = _prefix_filter(select(Promotion.code, Promotion.discount, _uses_left()), prefix)
+    rows = db.session.execute(query.order_by(Promotion.code).execution_options(yield_per=batch_size))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for partition in rows.partitions():
+        writer.writerows(partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield buffer.getvalue()
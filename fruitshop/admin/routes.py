@@ -1,17 +1,66 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import io
+
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
+from sqlalchemy import delete
+import click
 
 from fruitshop.auth.utils import admin_required
 from fruitshop.database import db
-from fruitshop.shop.models import Promotion
+from fruitshop.shop.models import Promotion, PromotionShard
+from fruitshop.shop.promotions import shard_promo, remaining_uses
+from fruitshop.shop.catalog import catalog
+from fruitshop.auth.identity import identity_cache
+from fruitshop.shop.reviews import review_card_cache
+from fruitshop.page_cache import page_cache
+from fruitshop.metrics import metrics
+from fruitshop.replicas import replica_router
+from fruitshop.shop.group_commit import checkout_writer
+from fruitshop.admin.analytics import sales_summary, rebuild_rollups
+from fruitshop.admin.promos import PromoImportError, clean_prefix, generate_codes, import_csv, export_csv, search_promos
+
+PROMOS_PER_PAGE = 50
+MAX_GENERATED_CODES = 100000
 
 bp = Blueprint('admin', __name__)
 
 @bp.route('/admin')
 @admin_required
 def index():
-    promo_codes = db.session.query(Promotion).all()
+    q = request.args.get('q', '').strip()
+    after = request.args.get('after')
     
-    return render_template('admin.html', promo_codes=promo_codes)
+    # One page of codes in code order, with sharded uses summed in the same query
+    rows, has_next = search_promos(q, after, PROMOS_PER_PAGE)
+    promo_codes = [promo for promo, _ in rows]
+    uses_left = {promo.id: uses for promo, uses in rows}
+    next_after = promo_codes[-1].code if has_next else None
+    
+    return render_template('admin.html', promo_codes=promo_codes, uses_left=uses_left, q=q, after=after, next_after=next_after)
+
+@bp.route('/admin/stats')
+@admin_required
+def stats():
+    return jsonify({
+        'catalog': catalog.stats(),
+        'identity': identity_cache.stats(),
+        'review_cards': review_card_cache.stats(),
+        'pages': page_cache.stats(),
+        'replicas': replica_router.stats(),
+        'checkout': checkout_writer.stats()
+    })
+
+@bp.route('/admin/analytics')
+@admin_required
+def analytics():
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    summary = sales_summary(days)
+    
+    return render_template('admin_analytics.html', days=days, summary=summary, fruits=catalog.get().by_id)
+
+@bp.route('/metrics')
+@admin_required
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @bp.route('/admin/promo', methods=['POST'])
 @admin_required
@@ -27,6 +76,9 @@ def add_promo():
         flash('Invalid input.', 'warning')
         return redirect(url_for('admin.index'))
     
+    if Promotion.query.filter_by(code=code).first():
+        flash('Promo code already exists.', 'warning')
+        return redirect(url_for('admin.index'))
     
     promo = Promotion(code=code, discount=discount, uses_left=uses_left)
     db.session.add(promo)
@@ -35,6 +87,55 @@ def add_promo():
     flash('Promo code added.', 'success')
     return redirect(url_for('admin.index'))
 
+@bp.route('/admin/promo/generate', methods=['POST'])
+@admin_required
+def generate_promos():
+    try:
+        prefix = clean_prefix(request.form.get('prefix', ''))
+        count = int(request.form['count'])
+        discount = round(float(request.form['discount']), 2)
+        uses_left = int(request.form['uses_left'])
+        
+        assert count > 0 and count <= MAX_GENERATED_CODES
+        assert discount >= 0 and discount <= 100
+        assert uses_left >= 0
+    except:
+        flash('Invalid input.', 'warning')
+        return redirect(url_for('admin.index'))
+    
+    generated = generate_codes(prefix, count, discount, uses_left)
+    
+    flash(f'Generated {generated} promo codes.', 'success')
+    return redirect(url_for('admin.index', q=prefix))
+
+@bp.route('/admin/promo/import', methods=['POST'])
+@admin_required
+def import_promos():
+    file = request.files.get('file')
+    if not file:
+        flash('Please choose a CSV file.', 'warning')
+        return redirect(url_for('admin.index'))
+    
+    try:
+        result = import_csv(io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline=''))
+    except (PromoImportError, UnicodeDecodeError) as e:
+        flash(f'Could not import the file: {e}', 'warning')
+        return redirect(url_for('admin.index'))
+    
+    flash(f'Imported {result["imported"]} promo codes, skipped {result["skipped"]} existing and {result["invalid"]} invalid rows.', 'success')
+    return redirect(url_for('admin.index'))
+
+@bp.route('/admin/promo/export.csv')
+@admin_required
+def export_promos():
+    # Streamed, so exporting every code never builds the whole file in memory
+    q = request.args.get('q', '').strip()
+    return Response(
+        stream_with_context(export_csv(q)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=promo-codes.csv'}
+    )
+
 @bp.route('/admin/promo/<int:code_id>/delete', methods=['POST'])
 @admin_required
 def delete_promo(code_id):
@@ -44,8 +145,70 @@ def delete_promo(code_id):
         flash('Promo code not found.', 'warning')
         return redirect(url_for('admin.index'))
     
+    db.session.execute(delete(PromotionShard).where(PromotionShard.promotion_id == promo.id))
     db.session.delete(promo)
     db.session.commit()
     
     flash('Promo code deleted.', 'success')
-    return redirect(url_for('admin.index'))
\ No newline at end of file
+    return redirect(url_for('admin.index'))
+
+@bp.cli.command('shard-promo')
+@click.argument('code')
+@click.argument('shards', type=int)
+def shard_promo_command(code, shards):
+    """Spread a promo code's uses over SHARDS counter rows (0 to merge them back)."""
+    promo = Promotion.query.filter_by(code=code).first()
+    if not promo:
+        raise click.ClickException(f'Promo code {code} not found.')
+    if shards < 0:
+        raise click.BadParameter('shards must be 0 or more.')
+    
+    shard_promo(promo, shards)
+    
+    click.echo(f'{code}: {remaining_uses(promo)} uses over {shards or 1} counter(s).')
+
+@bp.cli.command('rebuild-analytics')
+@click.option('--batch-size', type=int, default=5000)
+def rebuild_analytics_command(batch_size):
+    """Rebuild the daily sales rollups from all orders."""
+    with db.engine.begin() as connection:
+        count = rebuild_rollups(connection, batch_size)
+    
+    click.echo(f'Rebuilt the daily sales rollups from {count} orders.')
+
+@bp.cli.command('generate-promos')
+@click.argument('prefix')
+@click.argument('count', type=int)
+@click.option('--discount', type=float, required=True)
+@click.option('--uses', 'uses_left', type=int, default=1)
+def generate_promos_command(prefix, count, discount, uses_left):
+    """Generate COUNT random promo codes starting with PREFIX."""
+    try:
+        prefix = clean_prefix(prefix)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    if not 0 <= discount <= 100:
+        raise click.BadParameter('discount must be between 0 and 100.')
+    
+    generated = generate_codes(prefix, count, round(discount, 2), uses_left)
+    
+    click.echo(f'Generated {generated} promo codes.')
+
+@bp.cli.command('import-promos')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+def import_promos_command(file):
+    """Import promo codes from a CSV file with code, discount and uses_left columns."""
+    try:
+        result = import_csv(file)
+    except PromoImportError as e:
+        raise click.ClickException(str(e))
+    
+    click.echo(f'Imported {result["imported"]}, skipped {result["skipped"]} existing and {result["invalid"]} invalid rows.')
+
+@bp.cli.command('export-promos')
+@click.option('--prefix', default='')
+@click.argument('file', type=click.File('w'), default='-')
+def export_promos_command(prefix, file):
+    """Write promo codes, optionally only those starting with PREFIX, as CSV."""
+    for chunk in export_csv(prefix):
+        file.write(chunk)
@@ -0,0 +1,101 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from flask import current_app, session
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from fruitshop.database import db
+from fruitshop.auth.models import User
+
+class CachedUser(NamedTuple):
+    id: int
+    username: str
+    role: str
+    balance: float
+
+class IdentityCache:
+    # Per-worker LRU of users by (user id, identity version). The version lives in the
+    # session and is replaced whenever the user's own role or balance changes, so their
+    # next request misses in every worker. Changes made elsewhere are picked up within the TTL.
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int, version: str):
+        key = (user_id, version)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        self.misses += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+
+        cached = CachedUser(user.id, user.username, user.role, user.balance)
+        with self._lock:
+            self._entries[key] = (cached, now + current_app.config['IDENTITY_CACHE_TTL'])
+            self._entries.move_to_end(key)
+            while len(self._entries) > current_app.config['IDENTITY_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return cached
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'size': len(self._entries)
+        }
+
+identity_cache = IdentityCache()
+
+def new_identity_version() -> str:
+    return secrets.token_hex(4)
+
+def current_identity(user_id: int):
+    return identity_cache.get(user_id, session.get('identity_version'))
+
+def identity_changed(user_id: int):
+    # Called after committing a change to the current user's role or balance
+    identity_cache.invalidate(user_id)
+    if session.get('user_id') == user_id:
+        session['identity_version'] = new_identity_version()
+
+@event.listens_for(Session, 'before_flush')
+def _track_identity_changes(orm_session, flush_context, instances):
+    for obj in orm_session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if state.attrs.role.history.has_changes() or state.attrs.balance.history.has_changes():
+                orm_session.info.setdefault('identity_changed', set()).add(obj.id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_identities(orm_session):
+    for user_id in orm_session.info.pop('identity_changed', ()):
+        identity_cache.invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_identity_changes(orm_session):
+    orm_session.info.pop('identity_changed', None)
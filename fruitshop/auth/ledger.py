@@ -0,0 +1,93 @@
+from sqlalchemy import update, insert, select, cast, func, Numeric, bindparam
+
+from fruitshop.database import db
+from fruitshop.auth.models import User, BalanceLedger
+
+def record_entry(user_id: int, amount: float, reason: str, order_id: int = None):
+    db.session.execute(insert(BalanceLedger).values(
+        user_id=user_id,
+        amount=amount,
+        reason=reason,
+        order_id=order_id
+    ))
+
+def record_entries(entries: list[dict]):
+    # entries: {'user_id', 'amount', 'reason', 'order_id'}, written in one executemany
+    db.session.execute(insert(BalanceLedger), entries)
+
+def deduct_balance(user_id: int, amount: float) -> bool:
+    # Single conditional UPDATE, so parallel debits cannot overdraw or lose updates.
+    # Runs inside the caller's transaction; call it as late as possible to keep the row lock short.
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.balance >= amount)
+        .values(balance=func.round(cast(User.balance - amount, Numeric), 2))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def lock_balances(user_ids: list[int]):
+    # Locks the users' rows lowest id first, for a transaction that debits several of them
+    db.session.execute(
+        select(User.id).where(User.id.in_(sorted(set(user_ids)))).order_by(User.id).with_for_update()
+    ).all()
+
+def restore_balance(user_id: int, amount: float):
+    # Undoes deduct_balance() earlier in the same transaction
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(balance=func.round(cast(User.balance + amount, Numeric), 2))
+        .execution_options(synchronize_session=False)
+    )
+
+def debit_balance(user_id: int, amount: float, reason: str, order_id: int = None) -> bool:
+    if not deduct_balance(user_id, amount):
+        return False
+
+    record_entry(user_id, -amount, reason, order_id)
+    return True
+
+def reconcile_balances(fix: bool = False, batch_size: int = 1000):
+    # Walk users and per-user ledger sums side by side, both ordered by user id,
+    # so neither side is ever held in memory
+    users = db.session.execute(
+        select(User.id, User.balance).order_by(User.id).execution_options(yield_per=batch_size)
+    )
+    sums = db.session.execute(
+        select(BalanceLedger.user_id, func.sum(BalanceLedger.amount))
+        .group_by(BalanceLedger.user_id)
+        .order_by(BalanceLedger.user_id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    mismatches = []
+    checked = 0
+    ledger_row = next(sums, None)
+    for user_id, balance in users:
+        while ledger_row is not None and ledger_row[0] < user_id:
+            ledger_row = next(sums, None)
+
+        # None when the user has no ledger entries at all, their balance predates the ledger
+        expected = None
+        if ledger_row is not None and ledger_row[0] == user_id:
+            expected = round(ledger_row[1], 2)
+
+        checked += 1
+        if abs((balance or 0.0) - (expected or 0.0)) >= 0.005:
+            mismatches.append((user_id, balance, expected))
+
+    # Without any ledger entries there's nothing to recompute the balance from
+    fixable = [mismatch for mismatch in mismatches if mismatch[2] is not None]
+    if fix and fixable:
+        statement = (
+            update(User.__table__)
+            .where(User.__table__.c.id == bindparam('user_id'))
+            .values(balance=bindparam('expected'))
+        )
+        for start in range(0, len(fixable), batch_size):
+            batch = fixable[start:start + batch_size]
+            db.session.execute(statement, [{'user_id': user_id, 'expected': expected} for user_id, _, expected in batch])
+        db.session.commit()
+
+    return checked, mismatches
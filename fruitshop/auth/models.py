@@ -1,4 +1,5 @@
 from fruitshop.database import db
+from datetime import datetime
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -7,4 +8,12 @@ class User(db.Model):
     otp_secret = db.Column(db.String(100))
     role = db.Column(db.String(20), default='user')
     balance = db.Column(db.Float, default=0.0)
-    orders = db.relationship('Order', backref='user', lazy=True)
\ No newline at end of file
+    orders = db.relationship('Order', backref='user', lazy=True)
+
+class BalanceLedger(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    amount = db.Column(db.Float, nullable=False) # positive for credits, negative for debits
+    reason = db.Column(db.String(20), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
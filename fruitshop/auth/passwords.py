@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from fruitshop.metrics import timed
+
+class PasswordServiceBusy(Exception):
+    pass
+
+class PasswordHasher:
+    # Runs bcrypt on a small per-process thread pool, so a burst of logins can only
+    # occupy a bounded number of cores while the other request threads keep serving pages
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Thread pools don't survive a fork, so each worker process builds its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    workers = current_app.config['BCRYPT_WORKERS']
+                    queue = current_app.config['BCRYPT_QUEUE']
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt') if workers else None
+                    self._slots = threading.BoundedSemaphore(workers + queue) if workers else None
+                    self._pid = os.getpid()
+        return self._executor, self._slots
+
+    def _run(self, fn, *args):
+        executor, slots = self._pool()
+        if executor is None:
+            return fn(*args)
+
+        # Reject instead of queueing without bound when every slot is taken
+        if not slots.acquire(timeout=current_app.config['BCRYPT_QUEUE_TIMEOUT']):
+            raise PasswordServiceBusy()
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, password: str) -> str:
+        # Loaded on the first login or registration rather than at worker start
+        import bcrypt
+        rounds = current_app.config['BCRYPT_ROUNDS']
+        with timed('bcrypt_hash'):
+            return self._run(lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8'))
+
+    def check(self, password: str, password_hash: str) -> bool:
+        # Timed from the request's side, so waiting for a pool slot counts too
+        import bcrypt
+        with timed('bcrypt_check'):
+            return self._run(lambda: bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        # Hashes look like $2b$12$..., where 12 is the cost factor
+        try:
+            rounds = int(password_hash.split('$')[2])
+        except (IndexError, ValueError):
+            return False
+        return rounds != current_app.config['BCRYPT_ROUNDS']
+
+class TokenBucketLimiter:
+    # Per-key token buckets, kept for the most recently seen keys only
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+            return allowed
+
+password_hasher = PasswordHasher()
+
+def login_allowed(ip: str, username: str = None) -> bool:
+    # Checked before any database or bcrypt work
+    limiter = current_app.extensions.get('login_limiter')
+    if limiter is None:
+        config = current_app.config
+        limiter = current_app.extensions.setdefault(
+            'login_limiter',
+            TokenBucketLimiter(config['LOGIN_RATE_PER_MINUTE'] / 60, config['LOGIN_BURST'])
+        )
+
+    if not limiter.allow(('ip', ip)):
+        return False
+    if username is not None and not limiter.allow(('user', username)):
+        return False
+    return True
@@ -0,0 +1,38 @@
+import hashlib
+
+def provisioning_uri(username: str, otp_secret: str) -> str:
+    import pyotp
+    return pyotp.TOTP(otp_secret).provisioning_uri(username, issuer_name="Fruit Shop")
+
+def qr_etag(uri: str) -> str:
+    return hashlib.sha256(uri.encode('utf-8')).hexdigest()[:16]
+
+def qr_svg(uri: str) -> bytes:
+    # Not cached in the worker: the URI holds the TOTP secret. The browser caches the
+    # response instead, and revalidates it by ETag.
+    import qrcode
+
+    qr = qrcode.QRCode(border=2)
+    qr.add_data(uri)
+    matrix = qr.get_matrix()
+    size = len(matrix)
+
+    # One path segment per horizontal run of dark modules keeps the SVG small
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                path.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+            else:
+                x += 1
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(path)}"/>'
+        '</svg>'
+    ).encode('utf-8')
@@ -1,10 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-import pyotp
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort, current_app
+import click
 import datetime
 
 from fruitshop.database import db
 from fruitshop.auth.models import User
-from fruitshop.auth.utils import hash_password, check_password
+from fruitshop.auth.utils import hash_password, check_password, needs_rehash
+from fruitshop.auth.passwords import login_allowed, PasswordServiceBusy
+from fruitshop.auth.identity import current_identity, new_identity_version
+from fruitshop.auth.qr import provisioning_uri, qr_etag, qr_svg
+from fruitshop.auth.ledger import record_entry, reconcile_balances
+from fruitshop.replicas import pin_to_primary
 
 bp = Blueprint('auth', __name__)
 
@@ -21,15 +26,35 @@ def login():
         flash('Please enter a username and password.', 'danger')
         return redirect(url_for('auth.login'))
     
+    # Turn away excess attempts before doing any real work
+    if not login_allowed(request.remote_addr, username):
+        flash('Too many login attempts. Please wait a minute and try again.', 'danger')
+        return redirect(url_for('auth.login'))
+    
     # Get the user from the database
     user = User.query.filter_by(username=username).first()
 
     # Check if the user exists or if the password is correct
-    if not user or not check_password(password, user.password_hash):
+    try:
+        password_ok = user is not None and check_password(password, user.password_hash)
+    except PasswordServiceBusy:
+        flash('The server is busy. Please try again.', 'danger')
+        return redirect(url_for('auth.login'))
+    
+    if not password_ok:
         flash('Incorrect username or password.', 'danger')
         return redirect(url_for('auth.login'))
     
-    # Get valid 2fa codes
+    # Upgrade the hash if the configured cost factor changed since it was made
+    if needs_rehash(user.password_hash):
+        try:
+            user.password_hash = hash_password(password)
+            db.session.commit()
+        except PasswordServiceBusy:
+            pass # Keep the old hash, a later login will upgrade it
+    
+    # Get valid 2fa codes, pyotp is only loaded by the routes that need it
+    import pyotp
     otp = pyotp.TOTP(user.otp_secret)
     now = datetime.datetime.now()
     otp_codes = [otp.at(now, i) for i in range(-2, 3)]
@@ -49,8 +74,8 @@ def login_2fa():
     if not user_id or not otp_codes:
         return redirect(url_for('auth.login'))
 
-    # Get the user from the database
-    user = User.query.get(user_id)
+    # Get the user from the identity cache, a read-only snapshot
+    user = current_identity(user_id)
     if not user:
         return redirect(url_for('auth.login'))
 
@@ -74,6 +99,10 @@ def login_2fa():
     session['username'] = user.username
     session['role'] = user.role
     session['balance'] = user.balance
+    session['identity_version'] = new_identity_version()
+    
+    # A replica may not have caught up with a just-registered user yet
+    pin_to_primary()
     
     # Flash a success message
     flash(f"Logged in as: {session['username']}", 'success')
@@ -95,6 +124,11 @@ def register():
     if not username or not password:
         flash('Please enter a username and password.', 'danger')
         return redirect(url_for('auth.register'))
+    
+    # Turn away excess attempts before doing any real work
+    if not login_allowed(request.remote_addr):
+        flash('Too many attempts. Please wait a minute and try again.', 'danger')
+        return redirect(url_for('auth.register'))
 
     # Check if the username is already taken
     existing_user = User.query.filter_by(username=username).first()
@@ -103,9 +137,14 @@ def register():
         return redirect(url_for('auth.register'))
 
     # Hash the password
-    password_hash = hash_password(password)
+    try:
+        password_hash = hash_password(password)
+    except PasswordServiceBusy:
+        flash('The server is busy. Please try again.', 'danger')
+        return redirect(url_for('auth.register'))
 
     # Generate a random OTP secret
+    import pyotp
     otp_secret = pyotp.random_base32()
     
     # Get valid 2fa codes
@@ -134,11 +173,10 @@ def register_2fa():
         return redirect(url_for('auth.register'))
     
     if request.method == 'GET':
-        # Generate QR code
-        otp = pyotp.TOTP(otp_secret)
-        otp_url = otp.provisioning_uri(username, issuer_name="Fruit Shop")
+        # The QR code itself is served by register_2fa_qr, and cached by the browser
+        otp_url = provisioning_uri(username, otp_secret)
         
-        return render_template('register_2fa.html', otp_url=otp_url, otp_secret=otp_secret)
+        return render_template('register_2fa.html', qr_version=qr_etag(otp_url), otp_secret=otp_secret)
     
     otp_code = request.form.get('otp')
     
@@ -160,8 +198,10 @@ def register_2fa():
         balance=5.0
     )
 
-    # Save to database
+    # Save to database, recording the welcome credit in the ledger
     db.session.add(new_user)
+    db.session.flush()
+    record_entry(new_user.id, new_user.balance, 'register')
     db.session.commit()
     
     # Clear the session
@@ -173,10 +213,49 @@ def register_2fa():
     # Redirect to the login page
     return redirect(url_for('auth.login'))
 
+@bp.route('/register/2fa/qr.svg')
+def register_2fa_qr():
+    # Get the registration details from the session
+    username = session.get('register_username')
+    otp_secret = session.get('register_otp_secret')
+    
+    if not username or not otp_secret:
+        abort(404)
+    
+    otp_url = provisioning_uri(username, otp_secret)
+    etag = qr_etag(otp_url)
+    
+    # The browser already has this exact QR code
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(qr_svg(otp_url), mimetype='image/svg+xml')
+    
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = 600
+    return response
+
 @bp.route('/logout', methods=['GET', 'POST'])
 def logout():
     # Clear session
     session.clear()
     
     flash('Logged out.', 'success')
-    return redirect(url_for('auth.login'))
\ No newline at end of file
+    return redirect(url_for('auth.login'))
+
+@bp.cli.command('reconcile-balances')
+@click.option('--fix', is_flag=True, help='Overwrite mismatched balances with the ledger total.')
+def reconcile_balances_command(fix):
+    """Recompute every user balance from the balance ledger."""
+    checked, mismatches = reconcile_balances(fix=fix)
+    
+    for user_id, balance, expected in mismatches:
+        if expected is None:
+            click.echo(f'user {user_id}: balance {balance:.2f}, no ledger entries (left as is)')
+        else:
+            click.echo(f'user {user_id}: balance {balance:.2f}, ledger {expected:.2f}')
+    
+    action = 'fixed' if fix else 'found'
+    fixable = sum(1 for mismatch in mismatches if mismatch[2] is not None)
+    click.echo(f'Checked {checked} users, {action} {fixable if fix else len(mismatches)} mismatches.')
@@ -1,8 +1,8 @@
-import bcrypt
 from functools import wraps
 from flask import session, redirect, url_for, g
 
-from fruitshop.auth.models import User
+from fruitshop.auth.passwords import password_hasher
+from fruitshop.auth.identity import current_identity
 
 def login_required(f):
     @wraps(f)
@@ -12,8 +12,8 @@ def login_required(f):
         if not user_id:
             return redirect(url_for('auth.login'))
         
-        # Get the user from the database
-        user = User.query.get(user_id)
+        # Get the user from the identity cache, a read-only snapshot
+        user = current_identity(user_id)
         if not user:
             return redirect(url_for('auth.login'))
         
@@ -31,8 +31,8 @@ def admin_required(f):
         if not user_id:
             return redirect(url_for('auth.login'))
         
-        # Get the user from the database
-        user = User.query.get(user_id)
+        # Get the user from the identity cache, a read-only snapshot
+        user = current_identity(user_id)
         if not user:
             return redirect(url_for('auth.login'))
         
@@ -47,7 +47,10 @@ def admin_required(f):
     return decorated_function
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return password_hasher.hash(password)
 
 def check_password(password: str, password_hash: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
\ No newline at end of file
+    return password_hasher.check(password, password_hash)
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hasher.needs_rehash(password_hash)
\ No newline at end of file
@@ -1,5 +1,60 @@
 import secrets
 
 class Config:
-    SECRET_KEY = secrets.token_hex(32)
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///fruitshop.db'
\ No newline at end of file
+    SECRET_KEY = secrets.token_hex(32) # per process, set SECRET_KEY so all workers share one
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///fruitshop.db'
+    CATALOG_TTL = 30 # seconds between catalog version checks
+    
+    # Connection pool, per worker process
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 5
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+    
+    # Read replicas for read-only pages, comma-separated URIs, none by default
+    SQLALCHEMY_REPLICA_URIS = ''
+    REPLICA_MAX_LAG = 5 # seconds behind the primary before a replica is skipped, 0 = don't check
+    REPLICA_CHECK_INTERVAL = 5 # seconds between health checks, per worker process
+    REPLICA_PIN_SECONDS = 30 # reads stay on the primary this long after a user's own write
+    REPLICA_HEARTBEAT_INTERVAL = 1 # seconds between heartbeats written by `flask replica-heartbeat`
+    
+    # Password hashing, per worker process
+    BCRYPT_ROUNDS = 12
+    BCRYPT_WORKERS = 2 # 0 = hash on the request thread
+    BCRYPT_QUEUE = 16
+    BCRYPT_QUEUE_TIMEOUT = 2
+    LOGIN_RATE_PER_MINUTE = 10
+    LOGIN_BURST = 5
+    
+    # Checkout writes: 'direct' (each request commits its own order) or 'group'
+    # (a writer thread per worker process commits bursts of orders together)
+    CHECKOUT_MODE = 'direct'
+    CHECKOUT_BATCH_SIZE = 50 # orders per transaction at most
+    CHECKOUT_MAX_WAIT_MS = 5 # how long a batch may wait to fill
+    CHECKOUT_QUEUE = 500 # orders waiting per worker process before checkouts are turned away
+    CHECKOUT_WAIT_MS = 5000 # how long an order may wait in the queue before checkout gives up on it
+    
+    # Identity cache, per worker process
+    IDENTITY_CACHE_SIZE = 10000
+    IDENTITY_CACHE_TTL = 10 # seconds
+    
+    # Server-side sessions: 'sqlite' (shared by all workers), 'memory' (single worker) or 'cookie'
+    SESSION_BACKEND = 'sqlite'
+    SESSION_SQLITE_PATH = None # defaults to instance/sessions.db
+    SESSION_LIFETIME = 24 * 60 * 60 # seconds
+    SESSION_SWEEP_INTERVAL = 60 # seconds between expired session sweeps
+    
+    # Compiled templates on disk, shared by the workers and prebuilt in the image
+    TEMPLATE_CACHE = True
+    TEMPLATE_CACHE_PATH = None # defaults to instance/template_cache
+    
+    # Full-page cache for visitors who aren't logged in
+    PAGE_CACHE = True
+    PAGE_CACHE_SIZE = 512 # pages per worker process
+    PAGE_CACHE_SHARED_PATH = None # SQLite file shared by all workers on the host, off by default
+    
+    # Request instrumentation, served on /metrics
+    METRICS = True
+    SLOW_REQUEST_MS = 500 # log requests slower than this
+    N_PLUS_ONE_THRESHOLD = 10 # log requests running one statement this many times
\ No newline at end of file
@@ -1,38 +1,17 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    # Plain SELECTs go to the read replica chosen for the current request, if any.
+    # Flushes, writes and SELECT ... FOR UPDATE always go to the primary.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('replica_bind')
+            if replica and isinstance(clause, Select) and clause._for_update_arg is None:
+                return self._db.engines[replica]
 
-def init_database(db: SQLAlchemy):
-    from fruitshop.shop.models import Fruit, Order, OrderItem, Promotion, OrderReview
-    from fruitshop.auth.models import User
-    
-    db.create_all()
-    
-    # Create fruits
-    if db.session.query(Fruit).count() == 0:
-        fruits = [
-            Fruit(name='Apple', price=1.99),
-            Fruit(name='Orange', price=2.99),
-            Fruit(name='Peach', price=1.49),
-            Fruit(name='Blueberry', price=0.99),
-            Fruit(name='Strawberry', price=1.49),
-            Fruit(name='Kiwi', price=1.99),
-            Fruit(name='Lemon', price=0.99),
-            Fruit(name='Lime', price=0.99),
-            Fruit(name='Watermelon', price=4.99),
-        ]
-        db.session.bulk_save_objects(fruits)
-    
-    # Create admin user
-    if db.session.query(User).count() == 0:
-        from fruitshop.auth.models import User
-        from fruitshop.auth.utils import hash_password
-        user = User(username='admin', password_hash=hash_password('admin'), otp_secret='', role='admin')
-        db.session.add(user)
-    
-    # Create promotion
-    if db.session.query(Promotion).count() == 0:
-        promo = Promotion(code='10OFF', discount=10, uses_left=99999999)
-        db.session.add(promo)
-    
-    db.session.commit()
\ No newline at end of file
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+
+import click
+from flask import Blueprint, current_app, send_from_directory, url_for
+
+# Widths generated for every image, enough for 24-30px thumbnails and cards at 1x and 2x
+VARIANT_WIDTHS = (32, 64, 400, 800)
+FORMATS = ('png', 'webp')
+SOURCE_DIR = 'images'
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+bp = Blueprint('images', __name__)
+
+def build_images(static_folder: str) -> dict:
+    from PIL import Image
+
+    source_dir = os.path.join(static_folder, SOURCE_DIR)
+    build_dir = os.path.join(static_folder, BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+
+    manifest = {}
+    for filename in sorted(os.listdir(source_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() != '.png':
+            continue
+
+        variants = {}
+        with Image.open(os.path.join(source_dir, filename)) as source:
+            for width in VARIANT_WIDTHS:
+                if width > source.width:
+                    continue
+
+                height = round(source.height * width / source.width)
+                image = source.resize((width, height), Image.LANCZOS)
+
+                variants[width] = {}
+                for fmt in FORMATS:
+                    path = os.path.join(build_dir, f'{name}-{width}.{fmt}')
+                    if fmt == 'png':
+                        image.save(path, optimize=True)
+                    else:
+                        image.save(path, quality=85, method=6)
+
+                    # Name the file after its content, so its URL can be cached forever
+                    with open(path, 'rb') as f:
+                        digest = hashlib.sha256(f.read()).hexdigest()[:10]
+                    hashed = f'{name}-{width}.{digest}.{fmt}'
+                    os.replace(path, os.path.join(build_dir, hashed))
+                    variants[width][fmt] = hashed
+
+        manifest[f'{SOURCE_DIR}/{filename}'] = variants
+
+    with open(os.path.join(build_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+def load_manifest(app) -> dict:
+    path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        manifest = json.load(f)
+
+    # JSON keys are strings, widths are looked up as ints
+    return {
+        filename: {int(width): formats for width, formats in variants.items()}
+        for filename, variants in manifest.items()
+    }
+
+def _variant(filename: str, size: int):
+    variants = current_app.extensions['images'].get(filename)
+    if not variants:
+        return None
+
+    # Smallest variant at least as wide as the display size, else the largest
+    for width in sorted(variants):
+        if width >= size:
+            return variants[width]
+    return variants[max(variants)]
+
+def image_url(filename: str, size: int, fmt: str = 'png') -> str:
+    variant = _variant(filename, size)
+    if variant is None:
+        # Not built, serve the original
+        return url_for('static', filename=filename)
+
+    return url_for('images.build', filename=variant[fmt])
+
+def image_srcset(filename: str, size: int, fmt: str = 'png') -> str:
+    return f'{image_url(filename, size, fmt)} 1x, {image_url(filename, size * 2, fmt)} 2x'
+
+@bp.route('/static/build/<path:filename>')
+def build(filename):
+    response = send_from_directory(os.path.join(current_app.static_folder, BUILD_DIR), filename, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@click.command('build-images')
+def build_images_command():
+    """Generate resized, WebP and content-hashed variants of the static images."""
+    manifest = build_images(current_app.static_folder)
+
+    files = sum(len(formats) for variants in manifest.values() for formats in variants.values())
+    click.echo(f'Built {files} variants of {len(manifest)} images.')
+
+def init_images(app):
+    app.extensions['images'] = load_manifest(app)
+    app.jinja_env.globals['image_url'] = image_url
+    app.jinja_env.globals['image_srcset'] = image_srcset
+    app.register_blueprint(bp)
+    app.cli.add_command(build_images_command)
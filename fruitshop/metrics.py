@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    def __init__(self, name: str, description: str, label: str, buckets: tuple):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+
+            # Buckets are counted individually and made cumulative on export
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((label_value, (list(counts), total, count)) for label_value, (counts, total, count) in self._series.items())
+
+        for label_value, (counts, total, count) in series:
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+class Metrics:
+    # Per worker process, like the other in-process caches
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'fruitshop_request_duration_seconds', 'Wall time per request.', 'endpoint', TIME_BUCKETS)
+        self.sql_statements = Histogram(
+            'fruitshop_request_sql_statements', 'SQL statements per request.', 'endpoint', COUNT_BUCKETS)
+        self.sql_duration = Histogram(
+            'fruitshop_request_sql_duration_seconds', 'Time spent in SQL per request.', 'endpoint', TIME_BUCKETS)
+        self.template_duration = Histogram(
+            'fruitshop_template_render_seconds', 'Time per template render.', 'template', TIME_BUCKETS)
+        self.function_duration = Histogram(
+            'fruitshop_function_duration_seconds', 'Time per call of instrumented functions.', 'function', TIME_BUCKETS)
+
+    def histograms(self) -> list[Histogram]:
+        return [self.request_duration, self.sql_statements, self.sql_duration, self.template_duration, self.function_duration]
+
+    def render(self) -> str:
+        return '\n'.join(line for histogram in self.histograms() for line in histogram.render()) + '\n'
+
+metrics = Metrics()
+
+@contextmanager
+def timed(function: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.function_duration.observe(function, time.perf_counter() - start)
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+def _start_request():
+    g._request_stats = {
+        'start': time.perf_counter(),
+        'sql_count': 0,
+        'sql_time': 0.0,
+        'statements': Counter(),
+        'renders': []
+    }
+
+def _finish_request(exc):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return
+
+    endpoint = request.endpoint or 'unmatched'
+    elapsed = time.perf_counter() - stats['start']
+    metrics.request_duration.observe(endpoint, elapsed)
+    metrics.sql_statements.observe(endpoint, stats['sql_count'])
+    metrics.sql_duration.observe(endpoint, stats['sql_time'])
+
+    config = current_app.config
+    if elapsed * 1000 >= config['SLOW_REQUEST_MS']:
+        current_app.logger.warning(
+            'Slow request: %s %s took %.0fms, %d SQL statements in %.0fms',
+            endpoint, request.method, elapsed * 1000, stats['sql_count'], stats['sql_time'] * 1000
+        )
+
+    # The same statement run over and over in one request is usually a lazy load in a loop
+    if stats['statements']:
+        statement, count = stats['statements'].most_common(1)[0]
+        if count >= config['N_PLUS_ONE_THRESHOLD']:
+            current_app.logger.warning(
+                'Possible N+1 query: %s ran the same statement %d times: %s',
+                endpoint, count, ' '.join(statement.split())[:200]
+            )
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # One statement runs at a time on a connection, so one start time is enough
+    if _request_stats() is not None:
+        conn.info['_query_start'] = time.perf_counter()
+
+def _record_statement(conn, statement: str):
+    start = conn.info.pop('_query_start', None)
+    stats = _request_stats()
+    if stats is None or start is None:
+        return
+
+    stats['sql_count'] += 1
+    stats['sql_time'] += time.perf_counter() - start
+    stats['statements'][statement] += 1
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn, statement)
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute, but its time still counts
+    if exception_context.connection is not None and exception_context.statement is not None:
+        _record_statement(exception_context.connection, exception_context.statement)
+
+def _before_render(app, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats['renders'].append(time.perf_counter())
+
+def _after_render(app, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats['renders']:
+        metrics.template_duration.observe(template.name or 'string', time.perf_counter() - stats['renders'].pop())
+
+def init_metrics(app):
+    if not app.config['METRICS']:
+        return
+
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
@@ -0,0 +1,294 @@
+from datetime import datetime
+
+import click
+from sqlalchemy import (
+    Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table,
+    inspect, insert, literal, select, func, text
+)
+
+from fruitshop.database import db
+from fruitshop.shop.models import Fruit, Promotion, OrderReview, CatalogVersion, ReviewCounter
+from fruitshop.auth.models import User, BalanceLedger
+from fruitshop.replicas import ReplicationHeartbeat
+
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    date_applied = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        return f
+    return decorator
+
+def _has_column(connection, table: str, column: str) -> bool:
+    return any(c['name'] == column for c in inspect(connection).get_columns(table))
+
+# Tables as each migration created them. These stay as they are when the models change,
+# so a new database goes through the same steps as an old one; model changes get a new
+# migration instead.
+schema = MetaData()
+
+# Migration 1: the schema when migrations were introduced, less promotion.shards (migration 2)
+baseline = [
+    Table(
+        'user', schema,
+        Column('id', Integer, primary_key=True),
+        Column('username', String(50), unique=True, nullable=False),
+        Column('password_hash', String(100), nullable=False),
+        Column('otp_secret', String(100)),
+        Column('role', String(20)),
+        Column('balance', Float)
+    ),
+    Table(
+        'fruit', schema,
+        Column('id', Integer, primary_key=True),
+        Column('name', String(100), nullable=False),
+        Column('price', Float, nullable=False)
+    ),
+    Table(
+        'order', schema,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+        Column('promo', String(100)),
+        Column('subtotal', Float, nullable=False),
+        Column('discount', Float, nullable=False),
+        Column('total', Float, nullable=False),
+        Column('date_created', DateTime, nullable=False),
+        Index('ix_order_user_id_date_created', 'user_id', text('date_created DESC'))
+    ),
+    Table(
+        'order_item', schema,
+        Column('id', Integer, primary_key=True),
+        Column('order_id', Integer, ForeignKey('order.id'), nullable=False, index=True),
+        Column('fruit_id', Integer, ForeignKey('fruit.id'), nullable=False),
+        Column('quantity', Integer, nullable=False)
+    ),
+    Table(
+        'promotion', schema,
+        Column('id', Integer, primary_key=True),
+        Column('code', String(100), nullable=False, unique=True, index=True),
+        Column('discount', Float, nullable=False),
+        Column('uses_left', Integer, nullable=False)
+    ),
+    Table(
+        'promotion_shard', schema,
+        Column('promotion_id', Integer, ForeignKey('promotion.id', ondelete='CASCADE'), primary_key=True),
+        Column('shard', Integer, primary_key=True, autoincrement=False),
+        Column('uses_left', Integer, nullable=False)
+    ),
+    Table(
+        'order_review', schema,
+        Column('id', Integer, primary_key=True),
+        Column('order_id', Integer, ForeignKey('order.id'), nullable=False),
+        Column('title', String(50), nullable=False),
+        Column('comments', String(1000), nullable=False),
+        Column('date_created', DateTime, nullable=False),
+        Index('ix_order_review_date_created_id', 'date_created', 'id'),
+        Index('unique_order_id', 'order_id', unique=True)
+    ),
+    Table(
+        'catalog_version', schema,
+        Column('id', Integer, primary_key=True),
+        Column('version', Integer, nullable=False)
+    ),
+    Table(
+        'review_counter', schema,
+        Column('id', Integer, primary_key=True),
+        Column('review_count', Integer, nullable=False)
+    ),
+    Table(
+        'balance_ledger', schema,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer, ForeignKey('user.id'), nullable=False, index=True),
+        Column('amount', Float, nullable=False),
+        Column('reason', String(20), nullable=False),
+        Column('order_id', Integer, ForeignKey('order.id')),
+        Column('date_created', DateTime, nullable=False)
+    )
+]
+
+# Migration 5
+sales_rollups = [
+    Table(
+        'daily_sales', schema,
+        Column('day', Date, primary_key=True),
+        Column('orders', Integer, nullable=False),
+        Column('subtotal', Float, nullable=False),
+        Column('discount', Float, nullable=False),
+        Column('revenue', Float, nullable=False)
+    ),
+    Table(
+        'daily_fruit_sales', schema,
+        Column('day', Date, primary_key=True),
+        Column('fruit_id', Integer, ForeignKey('fruit.id'), primary_key=True, autoincrement=False),
+        Column('units', Integer, nullable=False)
+    ),
+    Table(
+        'daily_promo_redemptions', schema,
+        Column('day', Date, primary_key=True),
+        Column('promo', String(100), primary_key=True),
+        Column('redemptions', Integer, nullable=False),
+        Column('discount', Float, nullable=False)
+    )
+]
+
+# Migration 6
+replication_heartbeat = Table(
+    'replication_heartbeat', schema,
+    Column('id', Integer, primary_key=True),
+    Column('beat', Float, nullable=False)
+)
+
+def _create_tables(connection, tables: list[Table]):
+    # Only creates the tables that don't exist yet, along with their indexes
+    for table in tables:
+        table.create(connection, checkfirst=True)
+
+def _create_indexes(connection, tables: list[Table]):
+    # Indexes on tables that already existed before the indexes were declared
+    for table in tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+@migration(1, 'create tables')
+def create_tables(connection):
+    _create_tables(connection, baseline)
+
+@migration(2, 'add promotion.shards')
+def add_promotion_shards(connection):
+    if not _has_column(connection, 'promotion', 'shards'):
+        connection.execute(text('ALTER TABLE promotion ADD COLUMN shards INTEGER NOT NULL DEFAULT 0'))
+
+@migration(3, 'add secondary indexes')
+def add_secondary_indexes(connection):
+    _create_indexes(connection, baseline)
+
+@migration(4, 'seed catalog, admin user and promotion')
+def seed_data(connection):
+    from fruitshop.auth.utils import hash_password
+
+    # Create fruits
+    if connection.execute(select(func.count()).select_from(Fruit)).scalar() == 0:
+        connection.execute(insert(Fruit), [
+            {'name': 'Apple', 'price': 1.99},
+            {'name': 'Orange', 'price': 2.99},
+            {'name': 'Peach', 'price': 1.49},
+            {'name': 'Blueberry', 'price': 0.99},
+            {'name': 'Strawberry', 'price': 1.49},
+            {'name': 'Kiwi', 'price': 1.99},
+            {'name': 'Lemon', 'price': 0.99},
+            {'name': 'Lime', 'price': 0.99},
+            {'name': 'Watermelon', 'price': 4.99},
+        ])
+
+    # Create catalog version
+    if connection.execute(select(CatalogVersion.id)).first() is None:
+        connection.execute(insert(CatalogVersion).values(id=1, version=1))
+
+    # Create review counter
+    if connection.execute(select(ReviewCounter.id)).first() is None:
+        review_count = connection.execute(select(func.count()).select_from(OrderReview)).scalar()
+        connection.execute(insert(ReviewCounter).values(id=1, review_count=review_count))
+
+    # Create admin user
+    if connection.execute(select(func.count()).select_from(User)).scalar() == 0:
+        connection.execute(insert(User).values(
+            username='admin',
+            password_hash=hash_password('admin'),
+            otp_secret='',
+            role='admin',
+            balance=0.0
+        ))
+
+    # Create promotion
+    if connection.execute(select(func.count()).select_from(Promotion)).scalar() == 0:
+        connection.execute(insert(Promotion).values(code='10OFF', discount=10, uses_left=99999999, shards=0))
+
+@migration(5, 'add daily sales rollups')
+def add_sales_rollups(connection):
+    from fruitshop.admin.analytics import rebuild_rollups
+
+    _create_tables(connection, sales_rollups)
+    rebuild_rollups(connection)
+
+@migration(6, 'add replication heartbeat')
+def add_replication_heartbeat(connection):
+    _create_tables(connection, [replication_heartbeat])
+    if connection.execute(select(ReplicationHeartbeat.id)).first() is None:
+        connection.execute(insert(ReplicationHeartbeat).values(id=1, beat=0.0))
+
+@migration(7, 'add review search index')
+def add_review_search_index(connection):
+    from fruitshop.shop.search import create_search_index, reindex_reviews
+
+    create_search_index(connection)
+    reindex_reviews(connection)
+
+@migration(8, 'backfill opening balance ledger entries')
+def backfill_opening_balances(connection):
+    # Users created before the ledger existed get one entry for the balance they had,
+    # so reconciling doesn't mistake their whole balance for drift
+    has_entries = select(BalanceLedger.id).where(BalanceLedger.user_id == User.id).exists()
+    connection.execute(insert(BalanceLedger).from_select(
+        ['user_id', 'amount', 'reason', 'date_created'],
+        select(User.id, User.balance, literal('opening'), literal(datetime.utcnow()))
+        .where(~has_entries, User.balance.is_not(None), User.balance != 0)
+    ))
+
+@migration(9, 'add promotion code pattern index')
+def add_promotion_code_pattern_index(connection):
+    # Lets Postgres serve LIKE 'prefix%' from an index under any database collation
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_promotion_code_pattern ON promotion (code text_pattern_ops)'))
+
+def current_version(connection) -> int:
+    if not inspect(connection).has_table(SchemaMigration.__tablename__):
+        return 0
+
+    return connection.execute(select(func.max(SchemaMigration.version))).scalar() or 0
+
+def upgrade(target: int = None) -> list[tuple[int, str]]:
+    applied = []
+    with db.engine.connect() as connection:
+        # Serialize concurrent upgrades, e.g. several containers starting at once
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('SELECT pg_advisory_lock(7411)'))
+            connection.commit()
+
+        try:
+            SchemaMigration.__table__.create(connection, checkfirst=True)
+            connection.commit()
+
+            version = current_version(connection)
+            connection.commit()
+            for number, description, apply in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if number <= version or (target is not None and number > target):
+                    continue
+
+                # Each migration commits together with its version row
+                with connection.begin():
+                    apply(connection)
+                    connection.execute(insert(SchemaMigration).values(version=number, description=description))
+                applied.append((number, description))
+        finally:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text('SELECT pg_advisory_unlock(7411)'))
+                connection.commit()
+
+    return applied
+
+@click.command('db-upgrade')
+@click.option('--target', type=int, help='Stop after this migration version.')
+def upgrade_command(target):
+    """Create or upgrade the database schema and seed data."""
+    applied = upgrade(target)
+
+    for number, description in applied:
+        click.echo(f'Applied {number}: {description}')
+
+    if not applied:
+        click.echo('Database is up to date.')
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request, session, make_response
+
+from fruitshop.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class CachedPage:
+    __slots__ = ('version', 'content_type', 'bodies', 'etag', 'last_modified')
+
+    def __init__(self, version, content_type: str, body: bytes):
+        self.version = version
+        self.content_type = content_type
+        self.etag = hashlib.sha256(body).hexdigest()[:20]
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+        # Compress once per cache fill rather than once per response
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=6)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=5)
+
+    def respond(self, status: str):
+        response = current_app.response_class(status=200, content_type=self.content_type)
+        response.set_etag(self.etag, weak=True)
+        response.last_modified = self.last_modified
+        response.cache_control.no_cache = True
+        response.vary.update(('Accept-Encoding', 'Cookie'))
+        response.headers['X-Page-Cache'] = status
+
+        # The browser's copy is still current. If-Modified-Since only counts without an
+        # If-None-Match (RFC 7232 3.3), last_modified is just when this worker cached the page.
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(self.etag)
+        else:
+            not_modified = bool(request.if_modified_since and request.if_modified_since >= self.last_modified)
+        if not_modified:
+            response.status_code = 304
+            return response
+
+        encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in self.bodies]) or 'identity'
+        if encoding != 'identity':
+            response.content_encoding = encoding
+        response.set_data(self.bodies[encoding])
+        return response
+
+class SQLitePageStore:
+    # Shared by every worker on the host, so a page rendered by one worker serves them all
+
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+        self._writes = 0
+
+        self._connection().execute('CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, entry BLOB NOT NULL, stored REAL NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and never one inherited across a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key: str):
+        row = self._connection().execute('SELECT entry FROM page WHERE key = ?', (key,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key: str, page: CachedPage):
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO page (key, entry, stored) VALUES (?, ?, ?)',
+            (key, pickle.dumps(page), time.time())
+        )
+
+        # Trim the oldest pages now and then
+        self._writes += 1
+        if self._writes % 100 == 0:
+            connection.execute(
+                'DELETE FROM page WHERE key NOT IN (SELECT key FROM page ORDER BY stored DESC LIMIT ?)', (self.max_size,)
+            )
+
+class PageCache:
+    def __init__(self):
+        self.memory = None
+        self.shared = None
+
+    def init_app(self, app):
+        self.memory = LRUCache(max_size=app.config['PAGE_CACHE_SIZE'])
+        if app.config['PAGE_CACHE_SHARED_PATH']:
+            self.shared = SQLitePageStore(app.config['PAGE_CACHE_SHARED_PATH'], app.config['PAGE_CACHE_SIZE'])
+
+    def get(self, key: str, version):
+        page = self.memory.get(key)
+        if page is not None and page.version == version:
+            return page
+
+        if self.shared is not None:
+            page = self.shared.get(key)
+            if page is not None and page.version == version:
+                self.memory.set(key, page)
+                return page
+
+        return None
+
+    def set(self, key: str, page: CachedPage):
+        self.memory.set(key, page)
+        if self.shared is not None:
+            self.shared.set(key, page)
+
+    def stats(self) -> dict:
+        return self.memory.stats() if self.memory else {}
+
+page_cache = PageCache()
+
+def cache_anonymous_page(content_version):
+    # Caches a GET page for visitors who aren't logged in. content_version() returns what the
+    # page depends on, e.g. the catalog version, and a cached page is only served while it matches.
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Logged-in users and pending flash messages get a freshly rendered page
+            if not current_app.config['PAGE_CACHE'] or session.get('user_id') or session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            key = request.full_path
+            version = content_version()
+            page = page_cache.get(key, version)
+            if page is not None:
+                return page.respond('HIT')
+
+            # Only cache plain successful pages, not redirects
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or session.get('_flashes'):
+                return response
+
+            page = CachedPage(version, response.content_type, response.get_data())
+            page_cache.set(key, page)
+            return page.respond('MISS')
+        return decorated_function
+    return decorator
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, session
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from fruitshop.database import db
+
+class ReplicationHeartbeat(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # single row, id 1
+    beat = db.Column(db.Float, nullable=False, default=0.0) # unix time of the last write on the primary
+
+class ReplicaRouter:
+    # Per worker process. Each replica's health and lag are checked at most once per
+    # REPLICA_CHECK_INTERVAL, on whichever request needs them first.
+
+    def __init__(self):
+        self._state = {}
+        self._locks = {}
+        self.routed = 0
+        self.fallbacks = 0
+        self.pinned = 0
+
+    def _check(self, bind_key: str) -> dict:
+        # Lag is how far the replica's copy of the heartbeat trails the primary's. Only
+        # `flask replica-heartbeat` writes the heartbeat, checks just read it.
+        try:
+            with db.engines[None].connect() as connection:
+                primary_beat = connection.execute(select(ReplicationHeartbeat.beat).where(ReplicationHeartbeat.id == 1)).scalar()
+            with db.engines[bind_key].connect() as connection:
+                replica_beat = connection.execute(select(ReplicationHeartbeat.beat).where(ReplicationHeartbeat.id == 1)).scalar()
+        except SQLAlchemyError as e:
+            current_app.logger.warning('Replica %s is unavailable: %s', bind_key, e)
+            return {'healthy': False, 'lag': None, 'checked_at': time.monotonic()}
+
+        lag = None
+        if primary_beat is not None and replica_beat is not None:
+            lag = max(primary_beat - replica_beat, 0.0)
+
+        max_lag = current_app.config['REPLICA_MAX_LAG']
+        healthy = lag is not None and (not max_lag or lag <= max_lag)
+        if not healthy:
+            current_app.logger.warning('Replica %s is lagging by %s seconds', bind_key, 'unknown' if lag is None else f'{lag:.1f}')
+
+        # A heartbeat that stopped moving can't measure lag, so don't trust any replica then
+        if healthy and max_lag and time.time() - primary_beat > max_lag + current_app.config['REPLICA_HEARTBEAT_INTERVAL']:
+            current_app.logger.warning('Replica heartbeat is %.0f seconds old, is `flask replica-heartbeat` running?', time.time() - primary_beat)
+            healthy = False
+        return {'healthy': healthy, 'lag': lag, 'checked_at': time.monotonic()}
+
+    def _healthy(self, bind_key: str) -> bool:
+        state = self._state.get(bind_key)
+        if state is not None and time.monotonic() - state['checked_at'] < current_app.config['REPLICA_CHECK_INTERVAL']:
+            return state['healthy']
+
+        # One thread checks each replica, the others keep using its last result meanwhile
+        lock = self._locks.setdefault(bind_key, threading.Lock())
+        if not lock.acquire(blocking=state is None):
+            return state['healthy']
+        try:
+            state = self._state[bind_key] = self._check(bind_key)
+        finally:
+            lock.release()
+        return state['healthy']
+
+    def choose(self):
+        replicas = current_app.extensions.get('replicas')
+        if not replicas:
+            return None
+
+        # Read-your-writes: right after a user's own write, their reads stay on the primary
+        if session.get('primary_until', 0) > time.time():
+            self.pinned += 1
+            return None
+
+        healthy = [bind_key for bind_key in replicas if self._healthy(bind_key)]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+
+        self.routed += 1
+        return random.choice(healthy)
+
+    def stats(self) -> dict:
+        return {
+            'routed': self.routed,
+            'fallbacks': self.fallbacks,
+            'pinned': self.pinned,
+            'replicas': {
+                bind_key: {'healthy': state['healthy'], 'lag': state['lag']}
+                for bind_key, state in self._state.items()
+            }
+        }
+
+replica_router = ReplicaRouter()
+
+def replica_reads(f):
+    # For read-only views: their SELECTs may be served by a read replica
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.replica_bind = replica_router.choose()
+        return f(*args, **kwargs)
+    return decorated_function
+
+def pin_to_primary():
+    # Called after committing a write the user expects to see on their next page
+    if current_app.extensions.get('replicas'):
+        session['primary_until'] = time.time() + current_app.config['REPLICA_PIN_SECONDS']
+
+def replica_binds(uris: str, pool_options: dict) -> dict:
+    # SQLALCHEMY_REPLICA_URIS is a comma-separated list, each replica becomes a bind
+    # with the same pool settings as the primary (SQLite keeps SQLAlchemy's own pooling)
+    binds = {}
+    for i, uri in enumerate(uri.strip() for uri in uris.split(',')):
+        if uri:
+            binds[f'replica{i}'] = {'url': uri, **({} if uri.startswith('sqlite') else pool_options)}
+    return binds
+
+def beat(connection):
+    connection.execute(update(ReplicationHeartbeat).where(ReplicationHeartbeat.id == 1).values(beat=time.time()))
+
+@click.command('replica-heartbeat')
+@click.option('--once', is_flag=True, help='Write one heartbeat and exit, e.g. from cron.')
+def heartbeat_command(once):
+    """Keep writing the heartbeat row on the primary that replica lag is measured by."""
+    interval = current_app.config['REPLICA_HEARTBEAT_INTERVAL']
+    while True:
+        try:
+            with db.engines[None].begin() as connection:
+                beat(connection)
+        except SQLAlchemyError as e:
+            click.echo(f'Could not write the heartbeat: {e}', err=True)
+        if once:
+            return
+        time.sleep(interval)
+
+def init_replicas(app):
+    app.extensions['replicas'] = [key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica')]
+    app.cli.add_command(heartbeat_command)
@@ -0,0 +1,108 @@
+import argparse
+import logging
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from fruitshop.config import Config
+
+logger = logging.getLogger('gunicorn.error')
+
+def server_options() -> dict:
+    return {
+        'bind': os.environ.get('WEB_BIND', '0.0.0.0:5000'),
+        'workers': int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1)),
+        'threads': int(os.environ.get('WEB_THREADS', 4)),
+        'worker_class': 'gthread',
+        'timeout': int(os.environ.get('WEB_TIMEOUT', 30)),
+        'graceful_timeout': int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30)),
+        'keepalive': int(os.environ.get('WEB_KEEPALIVE', 5)),
+        'max_requests': int(os.environ.get('WEB_MAX_REQUESTS', 0)),
+        'max_requests_jitter': int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 0)),
+        'accesslog': os.environ.get('WEB_ACCESS_LOG', '-'),
+        # Each worker builds its own app, engine and pool after the fork
+        'preload_app': False,
+    }
+
+def secret_key_required(options: dict) -> bool:
+    backend = os.environ.get('SESSION_BACKEND', Config.SESSION_BACKEND)
+    return not os.environ.get('SECRET_KEY') and options['workers'] > 1 and backend == 'cookie'
+
+def concurrency_report(options: dict) -> list[str]:
+    workers = options['workers']
+    threads = options['threads']
+    pool_size = int(os.environ.get('DB_POOL_SIZE', Config.DB_POOL_SIZE))
+    max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', Config.DB_MAX_OVERFLOW))
+    max_pool = workers * (pool_size + max_overflow)
+
+    lines = [
+        f'{workers} workers x {threads} threads = {workers * threads} concurrent requests',
+        f'{workers} workers x ({pool_size} pool + {max_overflow} overflow) = up to {max_pool} database connections',
+    ]
+
+    # Without a shared key each worker signs with its own random one. That breaks sessions
+    # only when they live in signed cookies; server-side session cookies are plain ids.
+    if secret_key_required(options):
+        lines.append('ERROR: SECRET_KEY is not set, workers would not accept each other\'s session cookies')
+    elif not os.environ.get('SECRET_KEY') and workers > 1:
+        lines.append('WARNING: SECRET_KEY is not set, each worker uses its own random key')
+
+    if threads > pool_size + max_overflow:
+        lines.append('WARNING: more threads than pooled connections per worker, requests will queue on the pool')
+
+    # Compare against what Postgres will actually accept
+    uri = os.environ.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('postgresql'):
+        engine = create_engine(uri, poolclass=NullPool)
+        try:
+            with engine.connect() as connection:
+                max_connections = int(connection.execute(text('SHOW max_connections')).scalar())
+            lines.append(f'Postgres max_connections = {max_connections}')
+            if max_pool > max_connections:
+                lines.append('WARNING: workers can open more connections than Postgres allows')
+        except Exception as e:
+            lines.append(f'Could not read Postgres max_connections: {e}')
+        finally:
+            engine.dispose()
+
+    return lines
+
+class FruitShopServer(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set('when_ready', self.when_ready)
+
+    def load(self):
+        # Runs in each worker after the fork, so no engine or connection is ever shared
+        from fruitshop import create_app
+        return create_app()
+
+    def when_ready(self, server):
+        for line in concurrency_report(self.options):
+            logger.info(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the fruit shop with pre-forked, threaded workers.')
+    parser.add_argument('--check', action='store_true', help='Print the configured concurrency and exit.')
+    args = parser.parse_args()
+
+    options = server_options()
+    if args.check:
+        print('\n'.join(concurrency_report(options)))
+        return
+
+    if secret_key_required(options):
+        raise SystemExit('SECRET_KEY must be set when running more than one worker with SESSION_BACKEND=cookie.')
+
+    FruitShopServer(options).run()
+
+if __name__ == '__main__':
+    main()
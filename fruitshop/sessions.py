@@ -0,0 +1,173 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid: str = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.regenerate = False
+
+    def clear(self):
+        # Clearing happens on login and logout, so the session also gets a new id
+        super().clear()
+        self.regenerate = True
+
+class MemorySessionStore:
+    # Sessions in this process only, for a single worker or local development
+
+    def __init__(self, sweep_interval: float = 60):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._sweep_interval = sweep_interval
+        self._swept_at = time.monotonic()
+
+    def load(self, sid: str):
+        self._maybe_sweep()
+        entry = self._data.get(sid)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def save(self, sid: str, data: str, expires: float):
+        with self._lock:
+            self._data[sid] = (data, expires)
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._swept_at < self._sweep_interval:
+            return
+
+        with self._lock:
+            self._swept_at = time.monotonic()
+            now = time.time()
+            for sid in [sid for sid, (_, expires) in self._data.items() if expires < now]:
+                del self._data[sid]
+
+class SQLiteSessionStore:
+    # Sessions in a SQLite file, shared by every worker on the host
+
+    def __init__(self, path: str, sweep_interval: float = 60):
+        self.path = path
+        self._local = threading.local()
+        self._sweep_interval = sweep_interval
+        self._swept_at = time.monotonic()
+
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS session (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_session_expires ON session (expires)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, and never one inherited across a fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def load(self, sid: str):
+        self._maybe_sweep()
+        row = self._connection().execute(
+            'SELECT data FROM session WHERE sid = ? AND expires >= ?', (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid: str, data: str, expires: float):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO session (sid, data, expires) VALUES (?, ?, ?)', (sid, data, expires)
+        )
+
+    def delete(self, sid: str):
+        self._connection().execute('DELETE FROM session WHERE sid = ?', (sid,))
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._swept_at < self._sweep_interval:
+            return
+
+        self._swept_at = time.monotonic()
+        self._connection().execute('DELETE FROM session WHERE expires < ?', (time.time(),))
+
+class ServerSideSessionInterface(SessionInterface):
+    # The cookie only carries a random session id, the data stays on the server
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, lifetime: float):
+        self.store = store
+        self.lifetime = lifetime
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Drop the stored session once it has been emptied
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        # A cleared session is saved under a new id, so a pre-login id can't be reused after login
+        if session.regenerate and not session.new:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), time.time() + self.lifetime)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+def init_sessions(app):
+    backend = app.config['SESSION_BACKEND']
+    lifetime = app.config['SESSION_LIFETIME']
+    sweep_interval = app.config['SESSION_SWEEP_INTERVAL']
+
+    if backend == 'cookie':
+        return
+
+    if backend == 'memory':
+        store = MemorySessionStore(sweep_interval)
+    elif backend == 'sqlite':
+        path = app.config['SESSION_SQLITE_PATH'] or os.path.join(app.instance_path, 'sessions.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        store = SQLiteSessionStore(path, sweep_interval)
+    else:
+        raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
+
+    app.session_interface = ServerSideSessionInterface(store, lifetime)
@@ -0,0 +1,115 @@
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple
+
+from flask import current_app
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from fruitshop.database import db
+from fruitshop.shop.models import Fruit, CatalogVersion
+
+class CatalogFruit(NamedTuple):
+    id: int
+    name: str
+    price: float
+    image: str # static filename, sized variants come from image_url()
+
+class CatalogSnapshot:
+    __slots__ = ('version', 'fruits', 'by_id')
+
+    def __init__(self, version: int, fruits: tuple[CatalogFruit, ...]):
+        self.version = version
+        self.fruits = fruits
+        self.by_id = MappingProxyType({fruit.id: fruit for fruit in fruits})
+
+class CatalogCache:
+    def __init__(self):
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.version_checks = 0
+
+    def get(self, min_version: int = None) -> CatalogSnapshot:
+        # Within the TTL the snapshot is served without touching the database, unless the
+        # caller has seen a newer version than it holds, e.g. from another worker's price sheet
+        snapshot = self._snapshot
+        ttl = current_app.config['CATALOG_TTL']
+        if self._fresh(snapshot, ttl, min_version):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            # Another thread may have refreshed while we waited
+            snapshot = self._snapshot
+            if self._fresh(snapshot, ttl, min_version):
+                self.hits += 1
+                return snapshot
+
+            # Past the TTL, only reload the fruits if the catalog version moved
+            self.version_checks += 1
+            version = db.session.query(CatalogVersion.version).filter_by(id=1).scalar() or 0
+            if snapshot is None or snapshot.version != version:
+                self.misses += 1
+                snapshot = self._load(version)
+            else:
+                self.hits += 1
+
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def _fresh(self, snapshot: CatalogSnapshot, ttl: float, min_version: int = None) -> bool:
+        if snapshot is None or time.monotonic() - self._checked_at >= ttl:
+            return False
+        return min_version is None or snapshot.version >= min_version
+
+    def _load(self, version: int) -> CatalogSnapshot:
+        fruits = tuple(
+            CatalogFruit(
+                id=fruit.id,
+                name=fruit.name,
+                price=fruit.price,
+                image='images/' + fruit.name.lower() + '.png'
+            )
+            for fruit in Fruit.query.order_by(Fruit.id).all()
+        )
+        return CatalogSnapshot(version, fruits)
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'version_checks': self.version_checks,
+            'version': snapshot.version if snapshot else None,
+            'fruits': len(snapshot.fruits) if snapshot else 0
+        }
+
+catalog = CatalogCache()
+
+@event.listens_for(Session, 'before_flush')
+def _bump_catalog_version(session, flush_context, instances):
+    # Any change to a fruit bumps the shared version so every worker reloads
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, Fruit) for obj in changed):
+        session.connection().execute(
+            update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+        )
+        session.info['catalog_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_catalog(session):
+    # Don't wait for the TTL in the worker that made the change
+    if session.info.pop('catalog_changed', False):
+        catalog.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_change(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,235 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+
+from fruitshop.database import db
+from fruitshop.auth.ledger import lock_balances, deduct_balance, restore_balance, record_entries
+from fruitshop.shop.models import Order, OrderItem
+from fruitshop.shop.promotions import redeem_promo
+from fruitshop.admin.analytics import record_orders
+
+# Postgres deadlock_detected and serialization_failure
+RETRYABLE_PGCODES = ('40P01', '40001')
+
+class CheckoutBusy(Exception):
+    pass
+
+class CheckoutRejected(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+class PromoRef(NamedTuple):
+    # What redeem_promo() needs, safe to hand to the writer thread
+    id: int
+    code: str
+    shards: int
+
+class PendingOrder:
+    __slots__ = ('user_id', 'priced_cart', 'promo', 'order_id', 'error', 'done', 'claimed', 'cancelled', '_lock')
+
+    def __init__(self, user_id: int, priced_cart, promo: PromoRef = None):
+        self.user_id = user_id
+        self.priced_cart = priced_cart
+        self.promo = promo
+        self.order_id = None
+        self.error = None
+        self.done = threading.Event()
+        self.claimed = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def claim(self) -> bool:
+        # The writer takes the order, unless its request has already given up on it
+        with self._lock:
+            if not self.cancelled:
+                self.claimed = True
+            return self.claimed
+
+    def cancel(self) -> bool:
+        # Only an order the writer hasn't taken yet can be given up, it will never commit
+        with self._lock:
+            if not self.claimed:
+                self.cancelled = True
+            return self.cancelled
+
+    def result(self) -> int:
+        if self.error is not None:
+            raise self.error
+        return self.order_id
+
+class CheckoutWriter:
+    # Group commit for flash-sale bursts. Request threads queue validated orders and wait,
+    # one writer thread per worker process takes them in batches and commits each batch
+    # in a single transaction, so a burst costs a few commits instead of one per order.
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.orders = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def _start(self) -> queue.Queue:
+        # Threads don't survive a fork, so each worker process starts its own writer,
+        # and a writer that died is replaced, taking over the orders still queued
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(current_app.config['CHECKOUT_QUEUE'])
+                if self._pid != os.getpid() or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run,
+                        args=(current_app._get_current_object(), self._queue),
+                        name='checkout-writer',
+                        daemon=True
+                    )
+                    self._thread.start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def submit(self, user_id: int, priced_cart, promo=None) -> int:
+        pending = PendingOrder(user_id, priced_cart, PromoRef(promo.id, promo.code, promo.shards) if promo else None)
+
+        # End the caller's transaction, so no connection or row lock is held while waiting
+        db.session.rollback()
+
+        # Turn checkouts away instead of queueing without bound
+        try:
+            self._start().put_nowait(pending)
+        except queue.Full:
+            raise CheckoutBusy()
+
+        # An order the writer hasn't taken in time is given up. One it has taken is
+        # waited for, as long as the writer is still running.
+        if not pending.done.wait(current_app.config['CHECKOUT_WAIT_MS'] / 1000) and pending.cancel():
+            raise CheckoutBusy()
+        while not pending.done.wait(1):
+            if not self._thread.is_alive():
+                raise CheckoutRejected('Could not confirm the order, please check your order history.', 503)
+        return pending.result()
+
+    def _run(self, app, orders: queue.Queue):
+        batch_size = app.config['CHECKOUT_BATCH_SIZE']
+        max_wait = app.config['CHECKOUT_MAX_WAIT_MS'] / 1000
+        while True:
+            batch = [orders.get()]
+
+            # Let a burst fill the batch, but never hold the first order longer than max_wait.
+            # Orders queued while the last batch was committing are taken straight away.
+            deadline = time.monotonic() + max_wait
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(orders.get(timeout=timeout) if timeout > 0 else orders.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = [pending for pending in batch if pending.claim()]
+            if batch:
+                with app.app_context():
+                    self._write(batch)
+
+    def _apply(self, batch: list[PendingOrder]) -> list[PendingOrder]:
+        # Every writer takes its row locks in the same order as the direct checkout path:
+        # all user rows by id first, then promo rows by promotion and shard. So writers in
+        # different worker processes wait for each other instead of deadlocking.
+        lock_balances([pending.user_id for pending in batch])
+
+        # Each order is settled before the next one, so a refunded debit is back in the
+        # balance when the same user's next order is checked. One failure only rejects its own order.
+        accepted = []
+        for pending in sorted(batch, key=lambda pending: pending.promo.id if pending.promo else 0):
+            if not deduct_balance(pending.user_id, pending.priced_cart.total):
+                pending.error = CheckoutRejected('You do not have enough balance for this purchase.')
+            elif pending.promo and not redeem_promo(pending.promo, in_order=True):
+                # The user row is already locked by this transaction, so this takes no new lock
+                restore_balance(pending.user_id, pending.priced_cart.total)
+                pending.error = CheckoutRejected('This promo code has expired.')
+            else:
+                accepted.append(pending)
+
+        # Orders, items, ledger entries and rollups for the whole batch in a few statements
+        if accepted:
+            now = datetime.utcnow()
+            order_ids = db.session.scalars(insert(Order).returning(Order.id, sort_by_parameter_order=True), [
+                {
+                    'user_id': pending.user_id,
+                    'promo': pending.promo.code if pending.promo else None,
+                    'subtotal': pending.priced_cart.subtotal,
+                    'discount': pending.priced_cart.discount,
+                    'total': pending.priced_cart.total,
+                    'date_created': now
+                }
+                for pending in accepted
+            ]).all()
+            for pending, order_id in zip(accepted, order_ids):
+                pending.order_id = order_id
+            db.session.execute(insert(OrderItem), [
+                {'order_id': pending.order_id, 'fruit_id': item.fruit_id, 'quantity': item.quantity}
+                for pending in accepted
+                for item in pending.priced_cart.items
+            ])
+            record_entries([
+                {'user_id': pending.user_id, 'amount': -pending.priced_cart.total, 'reason': 'order', 'order_id': pending.order_id}
+                for pending in accepted
+            ])
+            record_orders(db.session.connection(), [
+                (now, pending.priced_cart, pending.promo.code if pending.promo else None)
+                for pending in accepted
+            ])
+
+        db.session.commit()
+        return accepted
+
+    def _write(self, batch: list[PendingOrder]):
+        try:
+            for attempt in range(2):
+                try:
+                    accepted = self._apply(batch)
+                    break
+                except DBAPIError as e:
+                    db.session.rollback()
+                    for pending in batch:
+                        pending.order_id = None
+                        pending.error = None
+                    # A deadlock or serialization failure is worth one more try
+                    if attempt or getattr(e.orig, 'pgcode', None) not in RETRYABLE_PGCODES:
+                        raise
+                    current_app.logger.warning('Retrying checkout batch of %d orders: %s', len(batch), e.orig)
+
+            self.batches += 1
+            self.orders += len(accepted)
+            self.rejected += len(batch) - len(accepted)
+        except Exception:
+            # Anything at all, the writer thread has to keep going
+            db.session.rollback()
+            current_app.logger.exception('Checkout batch of %d orders failed', len(batch))
+            for pending in batch:
+                pending.order_id = None
+                pending.error = CheckoutRejected('Could not place order, please try again.', 500)
+            self.failed += len(batch)
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'orders': self.orders,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'queued': self._queue.qsize() if self._queue is not None else 0
+        }
+
+checkout_writer = CheckoutWriter()
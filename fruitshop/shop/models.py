@@ -18,22 +18,43 @@ class Order(db.Model):
     review = db.relationship('OrderReview', backref='order', lazy=True) # one-to-one
     date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+# Order history: a user's orders, newest first
+db.Index('ix_order_user_id_date_created', Order.user_id, Order.date_created.desc())
+
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     fruit_id = db.Column(db.Integer, db.ForeignKey('fruit.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
 
 class Promotion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(100), nullable=False)
+    code = db.Column(db.String(100), nullable=False, unique=True, index=True)
     discount = db.Column(db.Float, nullable=False)
     uses_left = db.Column(db.Integer, nullable=False)
+    shards = db.Column(db.Integer, nullable=False, default=0) # 0 = uses_left is the counter, otherwise uses live in PromotionShard
+
+class PromotionShard(db.Model):
+    promotion_id = db.Column(db.Integer, db.ForeignKey('promotion.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    uses_left = db.Column(db.Integer, nullable=False)
 
 class OrderReview(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_review_date_created_id', 'date_created', 'id'), # feed order and keyset cursor
+        db.Index('unique_order_id', 'order_id', unique=True), # one review per order
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     title = db.Column(db.String(50), nullable=False)
     comments = db.Column(db.String(1000), nullable=False)
     date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    db.UniqueConstraint('order_id', name='unique_order_id')
+
+class CatalogVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # single row, id 1
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+class ReviewCounter(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # single row, id 1
+    review_count = db.Column(db.Integer, nullable=False, default=0)
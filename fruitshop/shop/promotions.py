@@ -0,0 +1,78 @@
+import random
+
+from sqlalchemy import update, delete, func
+
+from fruitshop.database import db
+from fruitshop.shop.models import Promotion, PromotionShard
+
+def promo_available(promo: Promotion) -> bool:
+    if not promo.shards:
+        return promo.uses_left > 0
+
+    # Plain read, no locks taken
+    return db.session.query(
+        PromotionShard.query.filter(
+            PromotionShard.promotion_id == promo.id,
+            PromotionShard.uses_left > 0
+        ).exists()
+    ).scalar()
+
+def remaining_uses(promo: Promotion) -> int:
+    if not promo.shards:
+        return promo.uses_left
+
+    return db.session.query(func.coalesce(func.sum(PromotionShard.uses_left), 0)).filter_by(promotion_id=promo.id).scalar()
+
+def redeem_promo(promo: Promotion, in_order: bool = False) -> bool:
+    # Decrement in the database, never in Python, so concurrent checkouts cannot lose updates
+    # or push a code below zero. Runs inside the caller's transaction and is undone on rollback.
+    if not promo.shards:
+        result = db.session.execute(
+            update(Promotion)
+            .where(Promotion.id == promo.id, Promotion.uses_left > 0)
+            .values(uses_left=Promotion.uses_left - 1)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    # Start at a random shard so workers spread their row locks, and fall through
+    # to the other shards when one runs dry. A transaction redeeming several times
+    # asks for in_order, so its shard locks are always taken lowest first.
+    shards = list(range(promo.shards))
+    if not in_order:
+        random.shuffle(shards)
+    for shard in shards:
+        result = db.session.execute(
+            update(PromotionShard)
+            .where(
+                PromotionShard.promotion_id == promo.id,
+                PromotionShard.shard == shard,
+                PromotionShard.uses_left > 0
+            )
+            .values(uses_left=PromotionShard.uses_left - 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return True
+
+    return False
+
+def shard_promo(promo: Promotion, shards: int):
+    # Lock the promotion while its uses are redistributed
+    promo = Promotion.query.filter_by(id=promo.id).with_for_update().one()
+    total = remaining_uses(promo)
+
+    db.session.execute(delete(PromotionShard).where(PromotionShard.promotion_id == promo.id))
+
+    if shards > 0:
+        per_shard, extra = divmod(total, shards)
+        db.session.add_all([
+            PromotionShard(promotion_id=promo.id, shard=shard, uses_left=per_shard + (1 if shard < extra else 0))
+            for shard in range(shards)
+        ])
+        promo.uses_left = 0
+    else:
+        promo.uses_left = total
+
+    promo.shards = shards
+    db.session.commit()
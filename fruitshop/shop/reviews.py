@@ -0,0 +1,94 @@
+from datetime import datetime
+
+from flask import get_template_attribute
+from markupsafe import Markup
+from sqlalchemy import event, update, and_, or_
+from sqlalchemy.orm import Session, joinedload
+
+from fruitshop.cache import LRUCache
+from fruitshop.database import db
+from fruitshop.shop.catalog import catalog
+from fruitshop.shop.models import Order, OrderReview, ReviewCounter
+
+REVIEWS_PER_PAGE = 9
+
+# Rendered review cards by (review id, catalog version)
+review_card_cache = LRUCache(max_size=4096)
+
+def review_count() -> int:
+    # Maintained counter, so the feed never runs COUNT(*) over the reviews table
+    return db.session.query(ReviewCounter.review_count).filter_by(id=1).scalar() or 0
+
+def encode_cursor(review) -> str:
+    return f'{review.date_created.isoformat()}_{review.id}'
+
+def decode_cursor(cursor: str):
+    try:
+        date_created, review_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(date_created), int(review_id)
+    except (AttributeError, ValueError):
+        return None
+
+def reviews_page(page: int, total: int, cursor: str = None) -> list:
+    # Only ids and dates, straight from the (date_created, id) index; cards come from the fragment cache
+    per_page = REVIEWS_PER_PAGE
+    query = db.session.query(OrderReview.id, OrderReview.date_created)
+    newest_first = (OrderReview.date_created.desc(), OrderReview.id.desc())
+
+    # Keyset pagination: continue straight after the last review of the previous page
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        date_created, review_id = position
+        return query.filter(or_(
+            OrderReview.date_created < date_created,
+            and_(OrderReview.date_created == date_created, OrderReview.id < review_id)
+        )).order_by(*newest_first).limit(per_page).all()
+
+    # Without a cursor, count from whichever end of the feed is nearer so deep pages stay cheap
+    start = (page - 1) * per_page
+    end = min(page * per_page, total)
+    if start <= total - end:
+        return query.order_by(*newest_first).offset(start).limit(per_page).all()
+
+    rows = query.order_by(
+        OrderReview.date_created.asc(), OrderReview.id.asc()
+    ).offset(total - end).limit(end - start).all()
+    return rows[::-1]
+
+def load_reviews(review_ids: list[int]) -> dict[int, OrderReview]:
+    # Reviewer and items come from two eager loads instead of lazy loads per review
+    reviews = OrderReview.query.options(
+        joinedload(OrderReview.order).joinedload(Order.user),
+        joinedload(OrderReview.order).selectinload(Order.items)
+    ).filter(OrderReview.id.in_(review_ids)).all()
+    return {review.id: review for review in reviews}
+
+def review_cards(rows: list) -> list[Markup]:
+    # Reviews never change once written, so a rendered card only goes stale with the catalog
+    snapshot = catalog.get()
+    cards = {}
+    for row in rows:
+        card = review_card_cache.get((row.id, snapshot.version))
+        if card is not None:
+            cards[row.id] = card
+
+    missing = [row.id for row in rows if row.id not in cards]
+    if missing:
+        render_card = get_template_attribute('_macros.html', 'review_card')
+        for review_id, review in load_reviews(missing).items():
+            card = Markup(render_card(review, [snapshot.by_id[item.fruit_id] for item in review.order.items]))
+            review_card_cache.set((review_id, snapshot.version), card)
+            cards[review_id] = card
+
+    return [cards[row.id] for row in rows if row.id in cards]
+
+@event.listens_for(Session, 'before_flush')
+def _count_reviews(session, flush_context, instances):
+    added = sum(isinstance(obj, OrderReview) for obj in session.new)
+    removed = sum(isinstance(obj, OrderReview) for obj in session.deleted)
+    if added != removed:
+        session.connection().execute(
+            update(ReviewCounter)
+            .where(ReviewCounter.id == 1)
+            .values(review_count=ReviewCounter.review_count + added - removed)
+        )
@@ -1,55 +1,108 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, g, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, g, session, current_app
+import click
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
 
 from fruitshop.database import db
 from fruitshop.auth.models import User
 from fruitshop.auth.utils import login_required
-from fruitshop.shop.models import Fruit, Promotion, Order, OrderItem, OrderReview
+from fruitshop.auth.ledger import debit_balance
+from fruitshop.auth.identity import current_identity, identity_changed
+from fruitshop.shop.models import Promotion, Order, OrderItem, OrderReview
+from fruitshop.shop.catalog import catalog
+from fruitshop.shop.reviews import REVIEWS_PER_PAGE, review_count, reviews_page, review_cards, encode_cursor
+from fruitshop.shop.utils import price_cart, order_previews, PricingError
+from fruitshop.shop.promotions import promo_available, redeem_promo
+from fruitshop.shop.group_commit import checkout_writer, CheckoutBusy, CheckoutRejected
+from fruitshop.shop.search import index_review, reindex_reviews, search_reviews
+from fruitshop.admin.analytics import record_order
+from fruitshop.page_cache import cache_anonymous_page
+from fruitshop.replicas import replica_reads, pin_to_primary
 
 bp = Blueprint('shop', __name__)
 
+ORDERS_PER_PAGE = 20
+PRICE_SHEET_MAX_AGE = 60 # seconds, a stale sheet is rejected at checkout
+PROMO_CHECK_MAX_AGE = 10 # seconds
+
+def _catalog_version():
+    return catalog.get().version
+
+def _reviews_version():
+    # Cards show fruit names, so the catalog counts as well as new reviews
+    return (catalog.get().version, review_count())
+
 @bp.route('/')
+@replica_reads
+@cache_anonymous_page(_catalog_version)
 def index():
     # Get fruits
-    fruits = Fruit.query.all()
+    fruits = catalog.get().fruits
     
     # Get user, if logged in
     user = None
     if session.get('user_id'):
-        user = User.query.get(session['user_id'])
+        user = current_identity(session['user_id'])
     
     return render_template('index.html', fruits=fruits, user=user)
 
+@bp.route('/checkout/prices')
+def price_sheet():
+    # Everything cart.js needs to price a cart itself. Versioned with the catalog, so a sheet
+    # cached past a price change is caught by checkout() instead of charging a surprise total.
+    snapshot = catalog.get()
+    etag = f'prices-{snapshot.version}'
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify({
+            'version': snapshot.version,
+            'prices': {fruit.id: fruit.price for fruit in snapshot.fruits}
+        })
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PRICE_SHEET_MAX_AGE
+    return response
+
+@bp.route('/checkout/promo')
+@replica_reads
+def promo_check():
+    # The one thing cart.js can't work out locally. Checkout redeems and checks it again.
+    promo = Promotion.query.filter_by(code=request.args.get('code', '')).first()
+    if not promo:
+        response, status = jsonify({'error': 'This promo code does not exist.'}), 404
+    elif not promo_available(promo):
+        response, status = jsonify({'error': 'This promo code has expired.'}), 404
+    else:
+        response, status = jsonify({'code': promo.code, 'discount': promo.discount}), 200
+    
+    response.cache_control.private = True
+    response.cache_control.max_age = PROMO_CHECK_MAX_AGE
+    return response, status
+
 @bp.route('/checkout/preview', methods=['POST'])
+@replica_reads
 def checkout_preview():
     # Get cart
     cart = request.json
     
     # Calculate subtotal
-    subtotal = 0
-    for fruit_id, quantity in cart['items'].items():
-        fruit = Fruit.query.get(fruit_id)
-        if not fruit:
-            return jsonify({'error': 'Invalid fruit id'}), 400
-        subtotal += fruit.price * quantity
-    subtotal = round(subtotal, 2)
+    try:
+        priced_cart = price_cart(cart['items'])
+    except PricingError as e:
+        return jsonify({'error': str(e)}), 400
 
     # Calculate discount
     promo = Promotion.query.filter_by(code=cart['promo']).first()
-    discount = 0
-    if promo and promo.uses_left > 0:
-        discount = promo.discount / 100 * subtotal
-        discount = round(discount, 2)
-        discount = min(discount, subtotal) # Discount cannot be more than subtotal
-    else:
+    if not promo or not promo_available(promo):
         promo = None
-        
-    # Calculate total
-    total = round(subtotal - discount, 2)
+    priced_cart.apply_promo(promo)
     
     return jsonify({
-        'subtotal': subtotal,
-        'discount': discount,
-        'total': total,
+        'subtotal': priced_cart.subtotal,
+        'discount': priced_cart.discount,
+        'total': priced_cart.total,
         'promo': promo.code if promo else None
     })
 
@@ -63,88 +116,142 @@ def checkout():
     if len(cart['items']) == 0:
         return jsonify({'error': 'Cart is empty.'}), 400
     
+    # The client priced the cart from a price sheet, which must still be current.
+    # The total charged is always worked out again here. A sheet newer than this
+    # worker's snapshot came from a worker that already reloaded, so catch up first.
+    price_version = cart.get('price_version')
+    if price_version is not None and price_version != catalog.get(
+        min_version=price_version if isinstance(price_version, int) else None
+    ).version:
+        return jsonify({'error': 'Prices have changed, please check your cart and try again.'}), 409
+    
     # Calculate subtotal
-    subtotal = 0
-    for fruit_id, quantity in cart['items'].items():
-        fruit = Fruit.query.get(fruit_id)
-        if not fruit:
-            return jsonify({'error': 'Invalid fruit id.'}), 400
-        subtotal += fruit.price * quantity
-    subtotal = round(subtotal, 2)
+    try:
+        priced_cart = price_cart(cart['items'])
+    except PricingError as e:
+        return jsonify({'error': str(e)}), 400
 
     # Get promotion discount
-    discount = 0
     promo = None
     if cart['promo']:
         promo = Promotion.query.filter_by(code=cart['promo']).first()
         if not promo:
             return jsonify({'error': 'This promo code does not exist.'}), 400
-        if promo.uses_left <= 0:
+        if not promo_available(promo):
             return jsonify({'error': 'This promo code has expired.'}), 400
 
-        discount = promo.discount
-
-    # Calculate discount
-    discount = discount / 100 * subtotal
-    discount = round(discount, 2)
-    discount = min(discount, subtotal) # Discount cannot be more than subtotal
-        
-    # Calculate total
-    total = round(subtotal - discount, 2)
+    # Calculate discount and total
+    priced_cart.apply_promo(promo)
+    total = priced_cart.total
+    user_id = g.user.id
     
-    if g.user.balance < total:
-        return jsonify({'error': 'You do not have enough balance for this purchase.'}), 400
+    # Group commit: hand the order to this worker's batch writer and wait for it
+    if current_app.config['CHECKOUT_MODE'] == 'group':
+        try:
+            order_id = checkout_writer.submit(user_id, priced_cart, promo)
+        except CheckoutBusy:
+            return jsonify({'error': 'The shop is busy. Please try again.'}), 503
+        except CheckoutRejected as e:
+            return jsonify({'error': str(e)}), e.status
+        return _order_placed(user_id, order_id)
     
-    # Decrement promotion uses
-    if promo:
-        promo.uses_left = promo.uses_left - 1
-        db.session.commit()
+    # Plain re-read for an early answer, the cached identity may be out of date.
+    # No row lock here: the conditional debit below is what prevents overdrafts.
+    balance = db.session.query(User.balance).filter_by(id=user_id).scalar()
+    if balance is None:
+        return jsonify({'error': 'Please log in again.'}), 401
     
-    # Create order
-    order = Order(
-        user_id=g.user.id,
-        promo=promo.code if promo else None,
-        subtotal=subtotal,
-        discount=discount,
-        total=total
-    )
-    db.session.add(order)
-    db.session.commit()
+    if balance < total:
+        return jsonify({'error': 'You do not have enough balance for this purchase.'}), 400
     
-    # Add items
-    for fruit_id, quantity in cart['items'].items():
-        fruit = Fruit.query.get(fruit_id)
-        item = OrderItem(
-            order=order,
-            fruit_id=fruit.id,
-            quantity=quantity
+    try:
+        # Create order
+        order = Order(
+            user_id=user_id,
+            promo=promo.code if promo else None,
+            subtotal=priced_cart.subtotal,
+            discount=priced_cart.discount,
+            total=total
         )
-        db.session.add(item)
+        db.session.add(order)
+        db.session.flush()
+        order_id = order.id
+        
+        # Add items in a single bulk insert
+        db.session.execute(insert(OrderItem), [
+            {
+                'order_id': order_id,
+                'fruit_id': priced_item.fruit_id,
+                'quantity': priced_item.quantity
+            }
+            for priced_item in priced_cart.items
+        ])
+        
+        # The contended rows come last: balance, promo and rollups are locked only
+        # from here until the commit
+        if not debit_balance(user_id, total, 'order', order_id):
+            db.session.rollback()
+            return jsonify({'error': 'You do not have enough balance for this purchase.'}), 400
+        
+        # Redeem the promotion
+        if promo and not redeem_promo(promo):
+            db.session.rollback()
+            return jsonify({'error': 'This promo code has expired.'}), 400
+        
+        # Add the order to the daily sales rollups
+        record_order(db.session.connection(), order.date_created, priced_cart, promo.code if promo else None)
+        
+        # Commit the whole order at once
         db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Could not place order, please try again.'}), 500
     
-    # Deduct from balance
-    g.user.balance = round(g.user.balance - total, 2)
-    db.session.commit()
+    return _order_placed(user_id, order_id)
+
+def _order_placed(user_id: int, order_id: int):
+    identity_changed(user_id)
+    pin_to_primary()
     
     flash('Order placed.', 'success')
     
     return jsonify({
         'success': True,
-        'order_id': order.id
+        'order_id': order_id
     }), 200
 
 @bp.route('/orders')
+@replica_reads
 @login_required
 def orders():
-    # Get orders in reverse chronological order
-    orders = Order.query.filter_by(user_id=g.user.id).order_by(Order.date_created.desc()).all()
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        return redirect(url_for('shop.orders'))
+    
+    # Get one page of orders in reverse chronological order, plus one to see if there is another page
+    orders = (
+        Order.query
+        .filter_by(user_id=g.user.id)
+        .order_by(Order.date_created.desc(), Order.id.desc())
+        .offset((page - 1) * ORDERS_PER_PAGE)
+        .limit(ORDERS_PER_PAGE + 1)
+        .all()
+    )
+    has_next = len(orders) > ORDERS_PER_PAGE
+    orders = orders[:ORDERS_PER_PAGE]
     
-    return render_template('orders.html', orders=orders)
+    # Get the item previews for the whole page at once
+    previews = order_previews([order.id for order in orders])
+    
+    return render_template('orders.html', orders=orders, previews=previews, page=page, has_next=has_next)
 
 @bp.route('/orders/<int:order_id>')
+@replica_reads
 @login_required
 def order(order_id):
-    order = Order.query.filter_by(id=order_id, user_id=g.user.id).first()
+    order = Order.query.options(
+        selectinload(Order.items).joinedload(OrderItem.fruit)
+    ).filter_by(id=order_id, user_id=g.user.id).first()
     if not order:
         flash('Order not found.', 'warning')
         return redirect(url_for('shop.orders'))
@@ -154,7 +261,9 @@ def order(order_id):
 @bp.route('/orders/<int:order_id>/review')
 @login_required
 def order_review(order_id):
-    order = Order.query.filter_by(id=order_id, user_id=g.user.id).first()
+    order = Order.query.options(
+        selectinload(Order.items).joinedload(OrderItem.fruit)
+    ).filter_by(id=order_id, user_id=g.user.id).first()
     if not order:
         flash('Order not found.', 'warning')
         return redirect(url_for('shop.orders'))
@@ -200,53 +309,50 @@ def order_review_submit(order_id):
         comments=comments
     )
     
+    # Add it to the search index in the same transaction
     db.session.add(review)
+    db.session.flush()
+    index_review(review)
     db.session.commit()
+    pin_to_primary()
     
     flash('Thank you for your review!', 'success')
     return redirect(url_for('shop.reviews'))
 
 @bp.route('/reviews', defaults={'page': 1})
 @bp.route('/reviews/<int:page>')
+@replica_reads
+@cache_anonymous_page(_reviews_version)
 def reviews(page):
-    per_page = 9
-    review_count = OrderReview.query.count()
-    total_pages = (review_count - 1) // per_page + 1
+    per_page = REVIEWS_PER_PAGE
+    total = review_count()
+    total_pages = (total - 1) // per_page + 1
     total_pages = max(total_pages, 1)
     
     if page < 1 or page > total_pages:
         flash('Page not found.', 'warning')
         return redirect(url_for('shop.reviews'))
     
-    reviews = OrderReview.query.order_by(OrderReview.date_created.desc()).paginate(page=page, per_page=per_page)
-    
-    reviews = [
-        {
-            'order_id': review.order_id,
-            'title': review.title,
-            'comments': review.comments,
-            'date': review.date_created.strftime('%B %d %Y'),
-            'username': review.order.user.username,
-            'order_items': [
-                {
-                    'name': item.fruit.name
-                }
-                for item in review.order.items
-            ]
-        }
-        for review in reviews
-    ]
-
-    review_contents = []
-
-    for review in reviews:
-        review_content = "<h5 class='card-title'>"
-        review_content += f'"{review["title"]}" by {review["username"]}\n'
-        for item in review["order_items"]:
-            review_content += f'<img src="{ url_for("static", filename="images/" + item["name"].lower() + ".png") }" alt="{ item["name"] }" class="mr-2" style="width: 24px; height: 24px;">'
-        review_content += "</h5>"
-        review_content += f'<p class="card-text">{ review["comments"] }</p>'
-        review_content += f'<p class="card-text">Written on { review["date"] }</p>'
-        review_contents.append(review_content)
-    
-    return render_template('reviews.html', reviews=review_contents, page=page, total_pages=total_pages)
\ No newline at end of file
+    rows = reviews_page(page, total, request.args.get('after'))
+    next_cursor = encode_cursor(rows[-1]) if rows else None
+    
+    return render_template('reviews.html', reviews=review_cards(rows), page=page, total_pages=total_pages, next_cursor=next_cursor)
+
+@bp.route('/reviews/search')
+@replica_reads
+def reviews_search():
+    q = request.args.get('q', '').strip()[:200]
+    page = max(request.args.get('page', 1, type=int), 1)
+    
+    rows, has_next = search_reviews(q, page)
+    
+    return render_template('reviews_search.html', reviews=review_cards(rows), q=q, page=page, has_next=has_next)
+
+@bp.cli.command('reindex-reviews')
+@click.option('--batch-size', type=int, default=1000)
+def reindex_reviews_command(batch_size):
+    """Rebuild the review search index from all reviews."""
+    with db.engine.begin() as connection:
+        count = reindex_reviews(connection, batch_size)
+    
+    click.echo(f'Indexed {count} reviews.')
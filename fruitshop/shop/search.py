@@ -0,0 +1,118 @@
+import re
+
+from sqlalchemy import column, select, table, text
+
+from fruitshop.database import db
+from fruitshop.shop.catalog import catalog
+from fruitshop.shop.models import Fruit, OrderItem, OrderReview
+
+# Full-text index over review titles, comments and the names of the fruits ordered.
+# SQLite uses an FTS5 table keyed by review id, Postgres a tsvector column with a GIN index.
+
+SEARCH_RESULTS_PER_PAGE = 9
+review_search = table('review_search')
+
+def create_search_index(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS review_search ('
+            'review_id INTEGER PRIMARY KEY REFERENCES order_review (id) ON DELETE CASCADE, '
+            'document TSVECTOR NOT NULL)'
+        ))
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_review_search_document ON review_search USING GIN (document)'))
+    else:
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS review_search USING fts5(title, comments, fruits, tokenize='porter unicode61')"
+        ))
+
+def index_reviews(connection, documents: list[dict]):
+    # documents: {'id', 'title', 'comments', 'fruits'}, added to the caller's transaction
+    if not documents:
+        return
+
+    if connection.dialect.name == 'postgresql':
+        # Matches in the title rank above fruit names, which rank above the comments
+        statement = text(
+            'INSERT INTO review_search (review_id, document) VALUES (:id, '
+            "setweight(to_tsvector('english', :title), 'A') || "
+            "setweight(to_tsvector('english', :fruits), 'B') || "
+            "setweight(to_tsvector('english', :comments), 'C')) "
+            'ON CONFLICT (review_id) DO UPDATE SET document = excluded.document'
+        )
+    else:
+        statement = text('INSERT OR REPLACE INTO review_search (rowid, title, comments, fruits) VALUES (:id, :title, :comments, :fruits)')
+
+    connection.execute(statement, documents)
+
+def index_review(review: OrderReview):
+    fruits = catalog.get().by_id
+    names = [fruits[item.fruit_id].name for item in review.order.items if item.fruit_id in fruits]
+    index_reviews(db.session.connection(), [{
+        'id': review.id,
+        'title': review.title,
+        'comments': review.comments,
+        'fruits': ' '.join(names)
+    }])
+
+def reindex_reviews(connection, batch_size: int = 1000) -> int:
+    # Rebuilds the whole index a batch of reviews at a time, keyed on review id
+    connection.execute(review_search.delete())
+
+    count = 0
+    last_id = 0
+    while True:
+        reviews = connection.execute(
+            select(OrderReview.id, OrderReview.order_id, OrderReview.title, OrderReview.comments)
+            .where(OrderReview.id > last_id)
+            .order_by(OrderReview.id)
+            .limit(batch_size)
+        ).all()
+        if not reviews:
+            return count
+
+        names = {}
+        items = connection.execute(
+            select(OrderItem.order_id, Fruit.name)
+            .join(Fruit, Fruit.id == OrderItem.fruit_id)
+            .where(OrderItem.order_id.in_([review.order_id for review in reviews]))
+        )
+        for order_id, name in items:
+            names.setdefault(order_id, []).append(name)
+
+        index_reviews(connection, [
+            {'id': review.id, 'title': review.title, 'comments': review.comments, 'fruits': ' '.join(names.get(review.order_id, []))}
+            for review in reviews
+        ])
+        count += len(reviews)
+        last_id = reviews[-1].id
+
+def search_reviews(query: str, page: int = 1) -> tuple[list, bool]:
+    # Best matches first: review ids for one page of results, and whether there's another page
+    per_page = SEARCH_RESULTS_PER_PAGE
+    if not query.strip():
+        return [], False
+
+    if db.session.get_bind().dialect.name == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', :q)"
+        statement = (
+            select(column('review_id').label('id'))
+            .select_from(review_search)
+            .where(text(f'document @@ {tsquery}'))
+            .order_by(text(f'ts_rank_cd(document, {tsquery}) DESC, review_id DESC'))
+        )
+        params = {'q': query}
+    else:
+        # Every word must match, quoted so FTS5 operators in the input are taken literally
+        words = re.findall(r'\w+', query)
+        if not words:
+            return [], False
+        statement = (
+            select(column('rowid').label('id'))
+            .select_from(review_search)
+            .where(text('review_search MATCH :q'))
+            .order_by(text('bm25(review_search, 10.0, 1.0, 5.0), rowid DESC'))
+        )
+        params = {'q': ' '.join(f'"{word}"' for word in words)}
+
+    rows = db.session.execute(statement.limit(per_page + 1).offset((page - 1) * per_page), params).all()
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,94 @@
+from sqlalchemy import select, func
+
+from fruitshop.database import db
+from fruitshop.shop.models import OrderItem
+from fruitshop.shop.catalog import catalog, CatalogFruit
+
+class PricingError(Exception):
+    pass
+
+class PricedItem:
+    __slots__ = ('fruit_id', 'name', 'price', 'quantity')
+
+    def __init__(self, fruit: CatalogFruit, quantity: int):
+        self.fruit_id = fruit.id
+        self.name = fruit.name
+        self.price = fruit.price
+        self.quantity = quantity
+
+    @property
+    def line_total(self) -> float:
+        return self.price * self.quantity
+
+class PricedCart:
+    def __init__(self, items: list[PricedItem]):
+        self.items = items
+        self.subtotal = round(sum(item.line_total for item in items), 2)
+        self.promo = None
+        self.discount = 0
+        self.total = self.subtotal
+
+    def apply_promo(self, promo):
+        # Calculate discount
+        discount = promo.discount / 100 * self.subtotal if promo else 0
+        discount = round(discount, 2)
+        discount = min(discount, self.subtotal) # Discount cannot be more than subtotal
+
+        # Calculate total
+        self.promo = promo
+        self.discount = discount
+        self.total = round(self.subtotal - discount, 2)
+
+def parse_cart_items(items) -> dict[int, int]:
+    # Validate the whole cart before touching the database
+    if not isinstance(items, dict):
+        raise PricingError('Invalid cart.')
+
+    quantities = {}
+    for fruit_id, quantity in items.items():
+        try:
+            fruit_id = int(fruit_id)
+        except (TypeError, ValueError):
+            raise PricingError('Invalid fruit id.')
+
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+            raise PricingError('Invalid quantity.')
+
+        quantities[fruit_id] = quantities.get(fruit_id, 0) + quantity
+
+    return quantities
+
+def price_cart(items) -> PricedCart:
+    quantities = parse_cart_items(items)
+
+    # Price from the cached catalog snapshot
+    fruits = catalog.get().by_id
+    if any(fruit_id not in fruits for fruit_id in quantities):
+        raise PricingError('Invalid fruit id.')
+
+    return PricedCart([PricedItem(fruits[fruit_id], quantity) for fruit_id, quantity in quantities.items()])
+
+def order_previews(order_ids: list[int], limit: int = 2) -> dict[int, dict]:
+    # Item counts and the first few items of every order, in one windowed query
+    ranked = select(
+        OrderItem.order_id,
+        OrderItem.fruit_id,
+        OrderItem.quantity,
+        func.row_number().over(partition_by=OrderItem.order_id, order_by=OrderItem.id).label('position'),
+        func.count().over(partition_by=OrderItem.order_id).label('item_count')
+    ).where(OrderItem.order_id.in_(order_ids)).subquery()
+
+    rows = db.session.execute(
+        select(ranked).where(ranked.c.position <= limit).order_by(ranked.c.order_id, ranked.c.position)
+    )
+
+    fruits = catalog.get().by_id
+    previews = {order_id: {'items': [], 'count': 0} for order_id in order_ids}
+    for row in rows:
+        preview = previews[row.order_id]
+        preview['count'] = row.item_count
+        # Past orders can hold fruits that have since left the catalog
+        if row.fruit_id in fruits:
+            preview['items'].append({'fruit': fruits[row.fruit_id], 'quantity': row.quantity})
+
+    return previews
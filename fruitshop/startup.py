@@ -0,0 +1,124 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import click
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+# Modules only some routes need, which a new worker shouldn't load before its first request
+LAZY_MODULES = ('bcrypt', 'pyotp', 'qrcode', 'PIL')
+
+def template_cache_path(app) -> str:
+    return app.config['TEMPLATE_CACHE_PATH'] or os.path.join(app.instance_path, 'template_cache')
+
+def compile_templates(app) -> int:
+    # Loading a template through the bytecode cache stores its compiled code
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+def cold_start(paths: list[str], importtime: bool = False, env: dict = None) -> dict:
+    # Runs a new interpreter that builds the app and serves its first requests, like a fresh worker
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-m', 'fruitshop.startup'] + paths
+    spawned_at = time.time()
+    result = subprocess.run(command, capture_output=True, text=True, env={**os.environ, **(env or {})})
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'startup failed')
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['started_ms'] = (report.pop('main_at') - spawned_at) * 1000
+    report['imports'] = parse_importtime(result.stderr) if importtime else []
+    return report
+
+def parse_importtime(output: str) -> list[tuple]:
+    # -X importtime lines: "import time: <self us> | <cumulative us> | <indented module name>"
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        imports.append((fields[2].strip(), int(fields[0]) / 1000, int(fields[1]) / 1000))
+    return imports
+
+@click.command('compile-templates')
+def compile_templates_command():
+    """Compile every template into the template cache, e.g. when building the image."""
+    if current_app.jinja_env.bytecode_cache is None:
+        raise click.ClickException('The template cache is turned off (TEMPLATE_CACHE=false).')
+
+    count = compile_templates(current_app)
+    click.echo(f'Compiled {count} templates into {template_cache_path(current_app)}.')
+
+@click.command('profile-startup')
+@click.option('--path', 'paths', multiple=True, default=['/'], help='Page to request first, repeatable.')
+@click.option('--top', default=15, help='Number of packages and modules to list.')
+def profile_startup_command(paths, top):
+    """Show where a new worker's start-up time goes: imports, create_app() and first requests."""
+    report = cold_start(list(paths), importtime=True)
+
+    # Import times are inflated a little by -X importtime itself
+    packages = defaultdict(float)
+    for name, self_ms, _ in report['imports']:
+        packages[name.split('.')[0]] += self_ms
+    slowest = sorted(report['imports'], key=lambda entry: entry[2], reverse=True)
+
+    click.echo(f'Interpreter start and imports: {report["started_ms"]:.0f}ms')
+    click.echo(f'create_app(): {report["create_app_ms"]:.0f}ms')
+    for request in report['requests']:
+        click.echo(f'First GET {request["path"]}: {request["status"]} in {request["ms"]:.0f}ms')
+    click.echo(f'Loaded before the first request: {", ".join(report["lazy_loaded"]) or "none of " + ", ".join(LAZY_MODULES)}')
+
+    click.echo(f'\nImport time by package (self, {len(report["imports"])} modules):')
+    for package, total in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        click.echo(f'{total:>9.1f}ms  {package}')
+
+    click.echo('\nSlowest modules (cumulative):')
+    for name, _, cumulative in slowest[:top]:
+        click.echo(f'{cumulative:>9.1f}ms  {name}')
+
+def init_templates(app):
+    # Compiled templates are kept on disk, keyed by a checksum of their source, so a new
+    # worker loads them instead of compiling each template again on its first use
+    if app.config['TEMPLATE_CACHE']:
+        path = template_cache_path(app)
+        try:
+            os.makedirs(path, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(path)
+        except OSError as e:
+            app.logger.warning('Template cache disabled, %s is not writable: %s', path, e)
+
+    app.cli.add_command(compile_templates_command)
+    app.cli.add_command(profile_startup_command)
+
+def main():
+    # The child side of cold_start(): timings go to stdout as one line of JSON
+    main_at = time.time()
+    start = time.perf_counter()
+
+    from fruitshop import create_app
+    app = create_app()
+    created = time.perf_counter()
+
+    client = app.test_client()
+    requests = []
+    for path in sys.argv[1:] or ['/']:
+        request_start = time.perf_counter()
+        response = client.get(path)
+        requests.append({'path': path, 'status': response.status_code, 'ms': (time.perf_counter() - request_start) * 1000})
+
+    print(json.dumps({
+        'main_at': main_at,
+        'create_app_ms': (created - start) * 1000,
+        'requests': requests,
+        'lazy_loaded': [name for name in LAZY_MODULES if name in sys.modules]
+    }))
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,9 @@
+// Price sheet from /checkout/prices, kept for the life of the page
+var priceSheet = null;
+
+// Pending promo code check while the shopper is typing
+var promoCheckTimer = null;
+
 function loadCartFromStorage() {
     // Get existing cart from the local session
     var cart = JSON.parse(localStorage.getItem('cart')) || {'items': [], 'promoCode': null};
@@ -31,6 +37,13 @@ async function openCart() {
     var cartOffcanvas = new bootstrap.Offcanvas(document.getElementById('cartOffcanvas'));
     cartOffcanvas.show();
 
+    // Carts saved before promo discounts were stored need their code checked again
+    if (cart.promoCode && cart.promoDiscount === undefined) {
+        let promo = await checkPromoCode(cart.promoCode);
+        cart.promoDiscount = promo ? promo.discount : null;
+        saveCartToStorage(cart);
+    }
+
     // Get the checkout preview
     let checkoutPreview = await getCheckoutPreview(cart);
 
@@ -75,10 +88,7 @@ async function removeFromCart(index) {
     // Update the local session with the updated cart items
     saveCartToStorage(cart);
 
-    // Display checkout preview loading
-    updateCheckoutPreview(true, null);
-
-    // Get the checkout preview
+    // Get the checkout preview, priced locally
     let checkoutPreview = await getCheckoutPreview(cart);
 
     // Refresh the cart display
@@ -105,20 +115,51 @@ function getCartDetails(cart) {
     return cartDetails;
 }
 
+async function loadPriceSheet(refresh) {
+    // Reuse the sheet already loaded, unless it turned out to be stale
+    if (priceSheet && !refresh) {
+        return priceSheet;
+    }
+
+    // The browser's HTTP cache answers repeat loads until the sheet's max-age runs out
+    const response = await fetch('/checkout/prices', { cache: refresh ? 'no-cache' : 'default' });
+    if (!response.ok) {
+        return null;
+    }
+    priceSheet = await response.json();
+    return priceSheet;
+}
+
+function roundCents(amount) {
+    return Math.round(amount * 100) / 100;
+}
+
 async function getCheckoutPreview(cart) {
-    // Prepare the cart for checkout preview
-    let cartDetails = getCartDetails(cart);
+    // Price the cart locally, the same way the server does at checkout
+    let sheet = await loadPriceSheet(false);
+    if (!sheet || cart.items.some(item => !(item.id in sheet.prices))) {
+        return null;
+    }
 
-    // Send a POST request to /checkout/preview to get the cart price
-    const response = await fetch('/checkout/preview', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(cartDetails),
-    });
-    const data = await response.json();
-    return data;
+    // Calculate subtotal, discount and total
+    let subtotal = roundCents(cart.items.reduce((sum, item) => sum + sheet.prices[item.id] * item.quantity, 0));
+    let discount = cart.promoDiscount ? Math.min(roundCents(cart.promoDiscount / 100 * subtotal), subtotal) : 0;
+
+    return {
+        subtotal: subtotal,
+        discount: discount,
+        total: roundCents(subtotal - discount),
+        promo: cart.promoDiscount ? cart.promoCode : null
+    };
+}
+
+async function checkPromoCode(promoCode) {
+    // Only the server knows whether a code exists and still has uses left
+    const response = await fetch('/checkout/promo?code=' + encodeURIComponent(promoCode));
+    if (!response.ok) {
+        return null;
+    }
+    return await response.json();
 }
 
 function updateCartDisplay(cart, checkoutPreview) {
@@ -210,34 +251,48 @@ function clearCheckoutError() {
     showCheckoutError('');
 }
 
+function schedulePromoCheck() {
+    // Check the code once the shopper stops typing, not on every keystroke
+    clearTimeout(promoCheckTimer);
+    promoCheckTimer = setTimeout(applyPromoCode, 400);
+}
+
 async function applyPromoCode() {
+    // A click on Apply replaces any check still waiting
+    clearTimeout(promoCheckTimer);
+
     // Get the promo code from the input field
     const promoCodeInput = document.getElementById('promoCode');
-    const promoCode = promoCodeInput.value;
-    
+    const promoCode = promoCodeInput.value.trim();
+
+    // Check the promo code, an empty one just removes the discount
+    let promo = promoCode ? await checkPromoCode(promoCode) : null;
+
+    // The shopper kept typing meanwhile, a newer check will follow
+    if (promoCodeInput.value.trim() !== promoCode) {
+        return;
+    }
+
     // Get existing cart from the local session
     var cart = loadCartFromStorage();
 
-    // Update the cart with the promo code
-    cart.promoCode = promoCode;
+    // Update the cart with the promo code and its discount
+    cart.promoCode = promo ? promo.code : promoCode;
+    cart.promoDiscount = promo ? promo.discount : null;
 
     // Update the local session with the updated cart items
     saveCartToStorage(cart);
 
-    // Display checkout preview loading
-    updateCheckoutPreview(true, null);
-
-    // Get the checkout preview
+    // Get the checkout preview, priced locally
     let checkoutPreview = await getCheckoutPreview(cart);
 
-    // Check if the promo code is valid
-    if (checkoutPreview.promo) {
-        // Update the saved promo code
-        cart.promoCode = checkoutPreview.promo;
-    }
-
     // Refresh the cart display
     updateCartDisplay(cart, checkoutPreview);
+
+    // Say why there's no discount
+    if (promoCode && !promo) {
+        showCheckoutError('This promo code is not valid.');
+    }
 }
 
 async function checkout() {
@@ -247,8 +302,9 @@ async function checkout() {
     // Clear the cart
     clearCartStorage();
 
-    // Prepare the cart for checkout preview
+    // Prepare the cart for checkout, with the version of the prices the shopper saw
     let cartDetails = getCartDetails(cart);
+    cartDetails.price_version = priceSheet ? priceSheet.version : null;
 
     // Post checkout request
     const response = await fetch('/checkout', {
@@ -276,6 +332,12 @@ async function checkout() {
         // Re-save the cart
         saveCartToStorage(cart);
 
+        // Prices changed since the sheet was loaded, show the cart at the new prices
+        if (response.status === 409) {
+            await loadPriceSheet(true);
+            updateCartDisplay(cart, await getCheckoutPreview(cart));
+        }
+
         const data = await response.json();
         showCheckoutError(data['error']);
         return;